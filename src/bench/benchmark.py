@@ -0,0 +1,213 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import islice
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'detect'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'train'))
+from candump import parse_record, read_records
+from gen_traffic import DEFAULT_ATTACKS, generate
+from type import *
+
+SIZES = (10000, 100000, 1000000)
+ID_COUNTS = (10, 100, 1000, 2000)  # distinct CAN IDs of the bench_ids() traces
+LATENCY_SAMPLE = 100000  # messages timed one by one, throughput always covers the whole trace
+
+perf_counter = time.perf_counter
+
+
+class StageResult:
+    def __init__(self, stage, n, seconds, latencies=None):
+        self.stage = stage
+        self.n = n
+        self.seconds = seconds
+        self.latencies = latencies
+
+    @property
+    def rate(self):
+        return self.n / self.seconds if self.seconds else float('inf')
+
+    def percentile(self, q):
+        if self.latencies is None or len(self.latencies) == 0:
+            return None
+        return float(np.percentile(self.latencies, q))
+
+    def row(self, size):
+        p50, p99 = self.percentile(50), self.percentile(99)
+        fmt = lambda p: '-' if p is None else '%.2f' % (1e6 * p)
+        return '%-9d %-14s %12.0f %10s %10s' % (size, self.stage, self.rate, fmt(p50), fmt(p99))
+
+
+def _timed(items, latencies: list):
+    """Yield items and record how long the consumer spent on each of them"""
+    for item in items:
+        start = perf_counter()
+        yield item
+        latencies.append(perf_counter() - start)
+
+
+def bench_parse(path, n):
+    """Throughput of the bulk candump reader, latency of parse_record() per line"""
+    start = perf_counter()
+    for _ in read_records(path):
+        pass
+    seconds = perf_counter() - start
+    latencies = []
+    with open(path, 'rb') as f:
+        for line in islice(f, LATENCY_SAMPLE):
+            t = perf_counter()
+            parse_record(line)
+            latencies.append(perf_counter() - t)
+    return StageResult('parse', n, seconds, latencies)
+
+
+def bench_decode(msgs):
+    import detect
+    detect.DECODE_CACHE.clear()
+    start = perf_counter()
+    for msg in msgs:
+        msg.signals = detect.decode_message(msg)
+    seconds = perf_counter() - start
+    detect.DECODE_CACHE.clear()
+    latencies = []
+    for msg in islice(msgs, LATENCY_SAMPLE):
+        t = perf_counter()
+        detect.decode_message(msg)
+        latencies.append(perf_counter() - t)
+    return StageResult('decode', len(msgs), seconds, latencies)
+
+
+def bench_match(msgs):
+    import detect
+    match_feature = detect.match_feature
+    state = DetectState()
+    start = perf_counter()
+    for msg in msgs:
+        match_feature(msg, state)
+    seconds = perf_counter() - start
+    state = DetectState()
+    latencies = []
+    for msg in islice(msgs, LATENCY_SAMPLE):
+        t = perf_counter()
+        match_feature(msg, state)
+        latencies.append(perf_counter() - t)
+    return StageResult('match_feature', len(msgs), seconds, latencies)
+
+
+def bench_batch(path, n):
+    import detect
+    start = perf_counter()
+    detect.detect_batch(path)
+    seconds = perf_counter() - start
+    return StageResult('detect_batch', n, seconds)
+
+
+def bench_train(path, n):
+    """extract_info() over the trace, per message latency covers decoding and FrameInfo updates"""
+    import extractInfo
+    read = extractInfo.read_file_generator
+    latencies = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            extractInfo.Frames.clear()
+            extractInfo.DECODE_CACHE.clear()
+            start = perf_counter()
+            extractInfo.extract_info(path)
+            seconds = perf_counter() - start
+            extractInfo.Frames.clear()
+            extractInfo.DECODE_CACHE.clear()
+            extractInfo.read_file_generator = lambda fileName: _timed(islice(read(fileName), LATENCY_SAMPLE),
+                                                                      latencies)
+            extractInfo.extract_info(path)
+    finally:
+        extractInfo.read_file_generator = read
+        extractInfo.Frames.clear()
+    return StageResult('train', n, seconds, latencies)
+
+
+def _time_extract_info(path):
+    import extractInfo
+    with contextlib.redirect_stdout(io.StringIO()):
+        extractInfo.Frames.clear()
+        extractInfo.DECODE_CACHE.clear()
+        start = perf_counter()
+        extractInfo.extract_info(path)
+        seconds = perf_counter() - start
+        extractInfo.Frames.clear()
+    return seconds
+
+
+def bench_ids(id_counts=ID_COUNTS, n=100000, work_dir=None, seed=0):
+    """extract_info() throughput on random frames spread over a growing number of IDs.
+
+    The marginal rate, from the extra time n more messages of the same IDs take, leaves
+    out the once per ID work (decoder compilation, handle_info()) and should stay flat."""
+    rnd = random.Random(seed)
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for count in id_counts:
+            ids = rnd.sample(range(0x800), count)
+            lines = ['(%.6f) can0 %03X#%016X 0\n' % (0.001 * k, ids[k % count], rnd.getrandbits(64))
+                     for k in range(2 * n)]
+            seconds = []
+            for size in (n, 2 * n):
+                path = os.path.join(tmp, 'ids_%d_%d.log' % (count, size))
+                with open(path, 'w') as f:
+                    f.write(''.join(lines[:size]))
+                seconds.append(_time_extract_info(path))
+            result = StageResult('train', n, seconds[0])
+            marginal = n / (seconds[1] - seconds[0]) if seconds[1] > seconds[0] else float('inf')
+            print('%-9d %-14s %12.0f %12.0f' % (count, result.stage, result.rate, marginal))
+            results.append((count, result, marginal))
+    return results
+
+
+def run(kg_file, sizes=SIZES, work_dir=None, train=True, seed=0, dbc_file=None):
+    import detect
+    detect.load_dbc(dbc_file)
+    detect.load_graph(kg_file)
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, 'trace_%d.log' % size)
+            generate(detect.graph_info, detect.SIGNAL_DECODER, size, path, DEFAULT_ATTACKS, seed)
+            msgs = list(detect.read_file_generator(path))
+            stages = [bench_parse(path, size), bench_decode(msgs), bench_match(msgs), bench_batch(path, size)]
+            if train:
+                stages.append(bench_train(path, size))
+            for stage in stages:
+                print(stage.row(size))
+            results.append((size, stages))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and per message latency of KG-ID on synthetic traffic')
+    parser.add_argument('--kg', default=r'../KG-ID.ttl')
+    parser.add_argument('--dbc', help='DBC of the KG signals, detect.DBC_FILE by default')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--work-dir', help='where the generated traces are written')
+    parser.add_argument('--no-train', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ids', type=int, nargs='*',
+                        help='instead, time training on random traffic over these numbers of IDs (default %s)' % (ID_COUNTS,))
+    args = parser.parse_args()
+
+    if args.ids is not None:
+        print('%-9s %-14s %12s %12s' % ('ids', 'stage', 'msgs/s', 'marginal'))
+        bench_ids(args.ids or ID_COUNTS, work_dir=args.work_dir, seed=args.seed)
+    else:
+        print('%-9s %-14s %12s %10s %10s' % ('size', 'stage', 'msgs/s', 'p50 us', 'p99 us'))
+        run(args.kg, args.sizes, args.work_dir, not args.no_train, args.seed, args.dbc)
+
+
+if __name__ == '__main__':
+    main()
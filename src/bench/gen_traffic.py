@@ -0,0 +1,262 @@
+import argparse
+import heapq
+import math
+import os
+import random
+import struct
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'detect'))
+from frame_rule import FrameRule
+from signal_decoder import FrameDecoder
+from type import *
+
+ACYCLIC_MEAN = 1.0  # mean gap in seconds of frames the KG knows no period for
+FUZZY_GAP = 0.0005  # smallest gap of the injected fuzzing frames
+FABRICATION_SPEEDUP = 10  # fabricated frames are sent this much faster than the real ones
+ATTACK_SHARE = 0.1  # frames an attack window injects, as a share of the normal frame rate
+# (attack, start, length), start and length as fractions of the trace duration
+DEFAULT_ATTACKS = ((FUZZY_ATTACK, 0.2, 0.05), (FABRICATION_ATTACK, 0.5, 0.05), (MASQUERADE_ATTACK, 0.8, 0.05))
+
+_LEGIT = 0
+
+
+class _SignalWalk:
+    """Random walk of one KG signal inside its range, moving at most its max rate per frame.
+
+    Integer signals walk their raw DBC value, float signals the physical one."""
+
+    def __init__(self, spec, signal: Signal, rnd: random.Random):
+        self.spec = spec
+        self.name = spec.name
+        rate = abs(signal.rate or 0)
+        if spec.is_float:
+            self.lo, self.hi, self.step = signal.minVal, signal.maxVal, rate
+            self.value = rnd.uniform(self.lo, self.hi)
+            return
+        scale = spec.scale or 1
+        a = (signal.minVal - spec.offset) / scale
+        b = (signal.maxVal - spec.offset) / scale
+        lo, hi = math.ceil(min(a, b) - 1e-9), math.floor(max(a, b) + 1e-9)
+        if spec.sign_bit:
+            lo, hi = max(lo, -spec.sign_bit), min(hi, spec.sign_bit - 1)
+        else:
+            lo, hi = max(lo, 0), min(hi, spec.mask)
+        if lo > hi:
+            lo = hi = min(max(round(a), lo), hi)
+        self.lo, self.hi = lo, hi
+        self.step = math.floor(rate / abs(scale) + 1e-9)
+        self.value = rnd.randint(lo, hi)
+
+    def next(self, rnd: random.Random):
+        if self.spec.is_float:
+            value = self.value + rnd.uniform(-self.step, self.step)
+        else:
+            value = self.value + rnd.randint(-self.step, self.step)
+        self.value = min(max(value, self.lo), self.hi)
+
+    def raw(self):
+        spec = self.spec
+        if not spec.is_float:
+            return self.value
+        fmt = '<f' if spec.length == 32 else '<d'
+        return int.from_bytes(struct.pack(fmt, (self.value - spec.offset) / (spec.scale or 1)), 'little')
+
+
+def _raw_value(spec, word):
+    big = word
+    little = int.from_bytes(word.to_bytes(8, 'big'), 'little')
+    raw = ((big if spec.big_endian else little) >> spec.shift) & spec.mask
+    if spec.sign_bit and raw & spec.sign_bit:
+        raw -= 1 << spec.length
+    return raw
+
+
+class _FrameModel:
+    """Payload source of one KG frame: signal walks encoded with the DBC layout plus the fixed bits"""
+
+    def __init__(self, frame: FrameInfo, signal_decoder, rnd: random.Random):
+        import detect
+        self.frame = frame
+        rule = FrameRule(frame, detect.alpha)
+        self.fixed_mask, self.fixed_val = rule.bits_mask, rule.bits_val
+        try:
+            decoder = signal_decoder.frame(frame.id)
+        except KeyError:
+            decoder = signal_decoder.fallback(frame.id)
+        self.decoder = decoder if isinstance(decoder, FrameDecoder) else None
+        specs = self.decoder.specs if self.decoder else []
+        self.walks = [_SignalWalk(spec, frame.signals[spec.name], rnd) for spec in specs
+                      if spec.name in frame.signals and frame.signals[spec.name].minVal is not None]
+        self.free = {spec.name: rnd.getrandbits(spec.length) for spec in specs if spec.name not in frame.signals}
+        self.word = self._fix(rnd.getrandbits(64))
+        if self.walks:
+            raws = dict(self.free)
+            raws.update((w.name, w.raw()) for w in self.walks)
+            self.word = self._fix(self._encode(raws))
+
+    def _fix(self, word):
+        return (word & ~self.fixed_mask) | self.fixed_val
+
+    def _encode(self, raws):
+        return int.from_bytes(self.decoder.encode(raws).ljust(8, b'\0'), 'big')
+
+    def next_word(self, rnd: random.Random):
+        """Step every signal walk and return the new payload, keeping the last one if the fixed bits break a signal"""
+        if not self.walks:
+            return self.word
+        last = [w.value for w in self.walks]
+        for w in self.walks:
+            w.next(rnd)
+        raws = dict(self.free)
+        raws.update((w.name, w.raw()) for w in self.walks)
+        word = self._fix(self._encode(raws))
+        for w, value in zip(self.walks, last):
+            if w.spec.is_float:
+                continue
+            raw = _raw_value(w.spec, word)
+            if not w.lo <= raw <= w.hi or abs(raw - value) > w.step:
+                for w2, value2 in zip(self.walks, last):
+                    w2.value = value2
+                return self.word
+        for w in self.walks:
+            if not w.spec.is_float:
+                w.value = _raw_value(w.spec, word)
+        self.word = word
+        return word
+
+    def forged_word(self, rnd: random.Random):
+        """Random signal values that keep the fixed bits, as an attacker knowing the frame layout would send"""
+        if self.decoder is None:
+            return self._fix(rnd.getrandbits(64))
+        raws = {spec.name: rnd.getrandbits(spec.length) for spec in self.decoder.specs}
+        return self._fix(self._encode(raws))
+
+
+def _period(frame: FrameInfo):
+    return frame.period if frame.isCycle and frame.period > 0 else None
+
+
+def _mean_gap(frame: FrameInfo):
+    """Mean gap of the generated frames of an ID, the jitter is drawn on top of the period"""
+    period = _period(frame)
+    if not period:
+        return ACYCLIC_MEAN
+    gap = period + (frame.jitter_min + frame.jitter_max) / 2
+    return gap if gap > 0 else period
+
+
+def _attack_targets(graph_info, cyclic, attack, wanted_rate, rnd: random.Random):
+    """Random cyclic IDs whose attack frames add up to wanted_rate frames/s, so frequent IDs count for more"""
+    targets = []
+    injected = 0.0
+    for f_id in rnd.sample(cyclic, len(cyclic)):
+        if injected >= wanted_rate:
+            break
+        targets.append(f_id)
+        frame = graph_info[f_id]
+        injected += (FABRICATION_SPEEDUP if attack == FABRICATION_ATTACK else 1) / _mean_gap(frame)
+    return frozenset(targets)
+
+
+def generate(graph_info: dict[int, FrameInfo], signal_decoder, n, fileName, attacks=DEFAULT_ATTACKS,
+             seed=0, start=0.0):
+    """Write an n frame candump log following the KG, labelled with the injected attack types.
+
+    Returns the number of frames written per label (0 for normal traffic)."""
+    rnd = random.Random(seed)
+    models = {f_id: _FrameModel(frame, signal_decoder, rnd) for f_id, frame in graph_info.items()}
+    rate = sum(1 / _mean_gap(f) for f in graph_info.values())
+    duration = n / rate if rate else n * FUZZY_GAP
+    fuzzy_gap = max(FUZZY_GAP, 1 / (ATTACK_SHARE * rate)) if rate else FUZZY_GAP
+
+    cyclic = sorted(f_id for f_id, f in graph_info.items() if _period(f) and f.signals)
+    windows = {}
+    events = []
+    seq = 0
+    for f_id, frame in graph_info.items():
+        period = _period(frame)
+        first = start + rnd.uniform(0, period if period else ACYCLIC_MEAN)
+        events.append((first, seq, _LEGIT, f_id))
+        seq += 1
+    for attack, begin, length in attacks:
+        t0, t1 = start + begin * duration, start + (begin + length) * duration
+        if attack == FUZZY_ATTACK:
+            windows[attack] = (t0, t1, None)
+            events.append((t0, seq, attack, None))
+            seq += 1
+            continue
+        if not cyclic:
+            continue
+        targets = _attack_targets(graph_info, cyclic, attack, ATTACK_SHARE * rate, rnd)
+        windows[attack] = (t0, t1, targets)
+        if attack == FABRICATION_ATTACK:
+            for f_id in sorted(targets):
+                first = t0 + rnd.uniform(0, _mean_gap(graph_info[f_id]) / FABRICATION_SPEEDUP)
+                if first < t1:
+                    events.append((first, seq, attack, f_id))
+                    seq += 1
+    heapq.heapify(events)
+
+    counts = {_LEGIT: 0}
+    counts.update((attack, 0) for attack in windows)
+    lines = []
+    written = 0
+    with open(fileName, 'w') as f:
+        while written < n and events:
+            ts, _, kind, f_id = heapq.heappop(events)
+            if kind == FUZZY_ATTACK:
+                f_id, word = rnd.randrange(0x800), rnd.getrandbits(64)
+                label, nxt = FUZZY_ATTACK, ts + fuzzy_gap
+            elif kind == FABRICATION_ATTACK:
+                word = models[f_id].forged_word(rnd)
+                label, nxt = FABRICATION_ATTACK, ts + _mean_gap(graph_info[f_id]) / FABRICATION_SPEEDUP
+            else:
+                frame = graph_info[f_id]
+                period = _period(frame)
+                masquerade = windows.get(MASQUERADE_ATTACK)
+                if masquerade and f_id in masquerade[2] and masquerade[0] <= ts < masquerade[1]:
+                    word, label = models[f_id].forged_word(rnd), MASQUERADE_ATTACK
+                else:
+                    word, label = models[f_id].next_word(rnd), _LEGIT
+                if period:
+                    nxt = ts + period + rnd.uniform(frame.jitter_min, frame.jitter_max)
+                else:
+                    nxt = ts + rnd.expovariate(1 / ACYCLIC_MEAN)
+            if kind != _LEGIT and nxt >= windows[kind][1]:
+                nxt = None
+            if nxt is not None:
+                heapq.heappush(events, (nxt, seq, kind, f_id))
+                seq += 1
+            lines.append('(%.6f) can0 %03X#%016X %d\n' % (ts, f_id, word, label))
+            counts[label] += 1
+            written += 1
+            if len(lines) >= 4096:
+                f.write(''.join(lines))
+                lines = []
+        f.write(''.join(lines))
+    return counts
+
+
+def main():
+    import detect
+    parser = argparse.ArgumentParser(description='Generate a labelled candump log from a KG')
+    parser.add_argument('--kg', default=r'../KG-ID.ttl')
+    parser.add_argument('--dbc', help='DBC of the KG signals, detect.DBC_FILE by default')
+    parser.add_argument('-n', type=int, default=100000, help='number of frames')
+    parser.add_argument('-o', '--out', default=r'../../data/synthetic/trace.log')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-attacks', action='store_true')
+    args = parser.parse_args()
+
+    detect.load_dbc(args.dbc)
+    detect.load_graph(args.kg)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    counts = generate(detect.graph_info, detect.SIGNAL_DECODER, args.n, args.out,
+                      () if args.no_attacks else DEFAULT_ATTACKS, args.seed)
+    print(args.out, counts)
+
+
+if __name__ == '__main__':
+    main()
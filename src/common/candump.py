@@ -0,0 +1,163 @@
+import binascii
+import re
+from itertools import repeat
+from typing import NamedTuple
+import numpy as np
+
+# (timestamp) can0 ID#DATA [label], label 0 marks a normal frame
+_LINE_PATTERN = re.compile(rb'^\(([^)]*)\) can0 ([0-9A-Fa-f]+)#([0-9A-Fa-f]*)(?: (\d))?\r?$', re.M)
+_SEPARATORS = bytes.maketrans(b'()#', b'   ')
+_HEX_DIGITS = b'0123456789ABCDEFabcdef'
+_PAYLOAD_LENGTHS = frozenset(range(0, 17, 2))  # hex digits of 0 to 8 data bytes, the DLC of the frame
+
+CHUNK_SIZE = 1 << 22
+BLOCK_SIZE = 1 << 18
+DEFAULT_DLC = 8  # the legacy readers report every frame as 8 bytes long
+
+
+class CanRecord(NamedTuple):
+    timestamp: float
+    id: int
+    dlc: int
+    data: bytes
+    normal: bool
+
+
+class ColumnBlock(NamedTuple):
+    ids: np.ndarray  # uint32
+    data: np.ndarray  # uint8 (n, 8), zero padded
+    dlc: np.ndarray  # uint8
+    timestamps: np.ndarray  # float64
+    labels: np.ndarray  # uint8, 0 for normal frames
+
+
+# one packed 22 byte row per frame, a record batch is a 1-d array of it
+RECORD_DTYPE = np.dtype([('timestamp', np.float64), ('id', np.uint32), ('dlc', np.uint8), ('label', np.uint8),
+                         ('data', np.uint8, (8,))])
+
+
+def _split_fields(chunk):
+    """Split whole lines into (timestamps, ids, data, labels) token lists, labels is None for unlabelled logs"""
+    lines = chunk.count(b'\n')
+    if not chunk.endswith(b'\n'):
+        lines += 1
+    # fast path: every line is well formed, so one split yields a fixed number of tokens per line
+    tokens = chunk.translate(_SEPARATORS).split()
+    for width in (5, 4):
+        if len(tokens) == width * lines and tokens[1::width].count(b'can0') == lines:
+            fields = tokens[0::width], tokens[2::width], tokens[3::width], tokens[4::width] if width == 5 else None
+            if _well_formed(*fields[1:]):
+                return fields
+            break
+    matches = _LINE_PATTERN.findall(chunk)
+    if not matches:
+        return [], [], [], None
+    ts, ids, data, labels = zip(*matches)
+    return ts, ids, data, [label or b'0' for label in labels]
+
+
+def _well_formed(ids, data, labels):
+    """True if the fast path tokens are hex ids, 0 to 8 hex data bytes and one digit labels"""
+    if b''.join(ids).translate(None, _HEX_DIGITS) or b''.join(data).translate(None, _HEX_DIGITS):
+        return False
+    if not _PAYLOAD_LENGTHS.issuperset(map(len, data)):
+        return False
+    if labels is None:
+        return True
+    joined = b''.join(labels)
+    return len(joined) == len(labels) and joined.isdigit()
+
+
+def parse_record(line):
+    """Return the CanRecord of one candump line, or None if the line is not a frame"""
+    match = _LINE_PATTERN.match(line.rstrip(b'\r\n'))
+    if match is None:
+        return None
+    ts, f_id, data, label = match.groups()
+    return CanRecord(float(ts), int(f_id, 16), DEFAULT_DLC, binascii.unhexlify(data), not label or int(label) == 0)
+
+
+def iter_fields(filename, chunk_size=CHUNK_SIZE):
+    """Yield the token lists of _split_fields() for every chunk of whole lines of a candump log"""
+    with open(filename, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            end = chunk.rfind(b'\n') + 1
+            if end == 0:
+                rest = chunk
+                continue
+            rest = chunk[end:]
+            fields = _split_fields(chunk[:end])
+            if fields[0]:
+                yield fields
+        if rest:
+            fields = _split_fields(rest)
+            if fields[0]:
+                yield fields
+
+
+def read_records(filename, chunk_size=CHUNK_SIZE):
+    """Yield a CanRecord for every frame of a candump log"""
+    for ts, ids, data, labels in iter_fields(filename, chunk_size):
+        normals = repeat(True) if labels is None else map((0).__eq__, map(int, labels))
+        rows = zip(map(float, ts), map(int, ids, repeat(16)), repeat(DEFAULT_DLC),
+                   map(binascii.unhexlify, data), normals)
+        yield from map(tuple.__new__, repeat(CanRecord), rows)
+
+
+def fields_to_batch(ts, ids, data, labels):
+    """Record batch of the token lists of _split_fields()"""
+    n = len(ts)
+    batch = np.zeros(n, dtype=RECORD_DTYPE)
+    batch['id'] = np.fromiter(map(int, ids, repeat(16)), dtype=np.uint32, count=n)
+    batch['timestamp'] = np.fromiter(map(float, ts), dtype=np.float64, count=n)
+    batch['label'] = np.fromiter(map(int, labels), dtype=np.uint8, count=n)
+    batch['dlc'] = DEFAULT_DLC
+    data_col = batch['data']
+    if set(map(len, data)) == {16}:  # every frame carries 8 bytes
+        data_col[:] = np.frombuffer(binascii.unhexlify(b''.join(data)), dtype=np.uint8).reshape(n, 8)
+    else:
+        for i, d in enumerate(data):
+            payload = binascii.unhexlify(d)[:8]
+            data_col[i, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+    return batch
+
+
+def batch_columns(batch: np.ndarray):
+    """ColumnBlock view of a record batch, the columns share its memory"""
+    return ColumnBlock(batch['id'], batch['data'], batch['dlc'], batch['timestamp'], batch['label'])
+
+
+def batch_records(batch: np.ndarray):
+    """Yield a CanRecord for every row of a record batch"""
+    data = np.ascontiguousarray(batch['data']).tobytes()
+    dlc = batch['dlc'].tolist()
+    payloads = (data[8 * i:8 * i + min(n, 8)] for i, n in enumerate(dlc))
+    normals = map((0).__eq__, batch['label'].tolist())
+    rows = zip(batch['timestamp'].tolist(), batch['id'].tolist(), dlc, payloads, normals)
+    return map(tuple.__new__, repeat(CanRecord), rows)
+
+
+def read_columns(filename, block_size=BLOCK_SIZE, chunk_size=CHUNK_SIZE):
+    """Yield the frames of a candump log as ColumnBlocks of at most block_size rows"""
+    return map(batch_columns, read_batches(filename, block_size, chunk_size))
+
+
+def read_batches(filename, block_size=BLOCK_SIZE, chunk_size=CHUNK_SIZE):
+    """Yield the frames of a candump log as RECORD_DTYPE record batches of at most block_size rows"""
+    pending = [[], [], [], []]
+    for ts, ids, data, labels in iter_fields(filename, chunk_size):
+        pending[0].extend(ts)
+        pending[1].extend(ids)
+        pending[2].extend(data)
+        pending[3].extend(repeat(b'0', len(ts)) if labels is None else labels)
+        while len(pending[0]) >= block_size:
+            head = [col[:block_size] for col in pending]
+            pending = [col[block_size:] for col in pending]
+            yield fields_to_batch(*head)
+    if pending[0]:
+        yield fields_to_batch(*pending)
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+class DecodeCache:
+    """Bounded LRU memo of decoded signal dicts keyed by (CAN ID, payload).
+
+    IDs whose payloads hardly ever repeat (counters, checksums) are detected after
+    `probe` lookups and bypass the cache, so they do not evict the static frames.
+    Cached dicts are shared between callers and must not be modified."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, probe=256, min_hit_rate=0.05):
+        self.capacity = capacity
+        self.probe = probe
+        self.min_hit_rate = min_hit_rate
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple[int, bytes], dict] = OrderedDict()
+        self._id_stats: dict[int, list[int]] = {}  # id: [hits, misses]
+        self._bypass: set[int] = set()
+
+    def get(self, frame_id, data):
+        """Return the cached decode of (frame_id, data), or None"""
+        if frame_id in self._bypass:
+            self.misses += 1
+            return None
+        key = (frame_id, data)
+        info = self._cache.get(key)
+        stats = self._id_stats.get(frame_id)
+        if stats is None:
+            stats = self._id_stats[frame_id] = [0, 0]
+        if info is None:
+            self.misses += 1
+            stats[1] += 1
+            if stats[1] >= self.probe and stats[0] < self.min_hit_rate * (stats[0] + stats[1]):
+                self._bypass.add(frame_id)
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        stats[0] += 1
+        return info
+
+    def put(self, frame_id, data, info):
+        if self.capacity <= 0 or frame_id in self._bypass:
+            return
+        self._cache[(frame_id, data)] = info
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+        self._id_stats.clear()
+        self._bypass.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __str__(self):
+        return 'DecodeCache: %d/%d entries, hits %d, misses %d (%.1f%%), bypassed ids %d' % (
+            len(self._cache), self.capacity, self.hits, self.misses, 100 * self.hit_rate, len(self._bypass))
@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+
+def file_digest(fileName):
+    sha = hashlib.sha256()
+    with open(fileName, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_path(cache_dir, fileName, suffix):
+    """Cache file of fileName in cache_dir, named after its base name and a hash of its absolute path"""
+    path = os.path.abspath(fileName)
+    name = os.path.basename(path) + '_' + hashlib.sha1(path.encode()).hexdigest()[:12] + suffix
+    return os.path.join(cache_dir, name)
+
+
+def file_key(fileName):
+    """Header fields binding a cache to the path, size and mtime of its source file"""
+    st = os.stat(fileName)
+    return {'path': os.path.abspath(fileName), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def same_source(header, key, fileName):
+    """True if a header with file_key() fields and a 'digest' still describes fileName, whose file_key() is key.
+
+    A file whose mtime changed is re-read to compare checksums."""
+    if header.get('path') != key['path'] or header.get('size') != key['size']:
+        return False
+    return header.get('mtime') == key['mtime'] or header.get('digest') == file_digest(fileName)
@@ -0,0 +1,8 @@
+import multiprocessing
+
+
+def pool_context():
+    """Multiprocessing context of the worker pools: fork where the platform has it, so workers
+    start with the modules already loaded, spawn elsewhere"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
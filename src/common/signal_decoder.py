@@ -0,0 +1,244 @@
+import struct
+import numpy as np
+
+BYTE_LAYOUT = [(8 * i + 1, 8) for i in range(8)]  # (start, length) of the byte-wise fallback signals
+
+
+class _SignalSpec:
+    """Shift/mask/scale/offset entry of one signal, shifts count from the LSB of the 64-bit payload word"""
+
+    def __init__(self, name, big_endian, shift, length, signed=False, is_float=False,
+                 scale=1, offset=0, conversion=None):
+        self.name = name
+        self.big_endian = big_endian
+        self.shift = shift
+        self.length = length
+        self.mask = (1 << length) - 1
+        self.sign_bit = 1 << (length - 1) if signed and not is_float else 0
+        self.is_float = is_float
+        self.scale = scale
+        self.offset = offset
+        self.identity = scale == 1 and offset == 0
+        self.conversion = conversion  # only kept for signals with value tables
+
+    def post(self):
+        """Return the raw value conversion of decode(), None for a plain raw * scale + offset"""
+        if self.is_float:
+            fmt = struct.Struct('<f' if self.length == 32 else '<d')
+            to_float = lambda raw: fmt.unpack(raw.to_bytes(fmt.size, 'little'))[0]
+            if self.conversion is not None:
+                return lambda raw: self.conversion.raw_to_scaled(to_float(raw), True)
+            if self.identity:
+                return to_float
+            return lambda raw: to_float(raw) * self.scale + self.offset
+        if self.conversion is not None:
+            return lambda raw: self.conversion.raw_to_scaled(raw, True)
+        return None
+
+
+def _dbc_spec(sig):
+    if sig.byte_order == 'little_endian':
+        big_endian, shift = False, sig.start
+    else:
+        pos = 8 * (sig.start // 8) + 7 - sig.start % 8  # MSB first bit index
+        big_endian, shift = True, 64 - pos - sig.length
+    choices = getattr(sig, 'choices', None)
+    conversion = getattr(sig, 'conversion', None) if choices else None
+    return _SignalSpec(sig.name, big_endian, shift, sig.length, sig.is_signed, sig.is_float,
+                       sig.scale, sig.offset, conversion)
+
+
+class FrameDecoder:
+    """Decoder of one frame, applied to a single payload or to a (n, 8) uint8 payload matrix"""
+
+    def __init__(self, specs: list[_SignalSpec], length=8):
+        self.specs = specs
+        self.length = length
+        self.names = [spec.name for spec in specs]
+        self._big = any(spec.big_endian for spec in specs)
+        self._little = any(not spec.big_endian for spec in specs)
+        self._subsets: dict[tuple, FrameDecoder] = {}
+        self.decode = self._compile()  # decode(data: bytes) -> dict
+
+    def subset(self, names):
+        """Return a decoder for the given signals only, in the given order; built once per list of names"""
+        names = tuple(names)
+        decoder = self._subsets.get(names)
+        if decoder is None:
+            specs = {spec.name: spec for spec in self.specs}
+            decoder = self._subsets[names] = FrameDecoder([specs[name] for name in names], self.length)
+        return decoder
+
+    def _compile(self):
+        """Generate a straight-line decode(data) for this table"""
+        src = ['def decode(data):',
+               '    pad = 8 - len(data)',
+               '    if pad < 0:',
+               '        data, pad = data[:8], 0']
+        if self._big:
+            src.append("    big = int.from_bytes(data, 'big') << 8 * pad")
+        if self._little:
+            src.append("    little = int.from_bytes(data, 'little')")
+        env = {}
+        items = []
+        for i, spec in enumerate(self.specs):
+            word = 'big' if spec.big_endian else 'little'
+            src.append('    v%d = (%s >> %d) & %d' % (i, word, spec.shift, spec.mask))
+            if spec.sign_bit:
+                src.append('    if v%d & %d:' % (i, spec.sign_bit))
+                src.append('        v%d -= %d' % (i, 1 << spec.length))
+            post = spec.post()
+            if post is not None:
+                env['post%d' % i] = post
+                items.append('%r: post%d(v%d)' % (spec.name, i, i))
+            elif spec.identity:
+                items.append('%r: v%d' % (spec.name, i))
+            else:
+                env['scale%d' % i] = spec.scale
+                env['offset%d' % i] = spec.offset
+                items.append('%r: v%d * scale%d + offset%d' % (spec.name, i, i, i))
+        src.append('    return {%s}' % ', '.join(items))
+        exec('\n'.join(src), env)
+        return env['decode']
+
+    def encode(self, raws: dict) -> bytes:
+        """Pack raw signal values (float signals as their bit pattern) into a payload, missing signals stay 0"""
+        big = little = 0
+        for spec in self.specs:
+            raw = raws.get(spec.name)
+            if raw is None:
+                continue
+            bits = (raw & spec.mask) << spec.shift
+            if spec.big_endian:
+                big |= bits
+            else:
+                little |= bits
+        word = big | int.from_bytes(little.to_bytes(8, 'little'), 'big')
+        return word.to_bytes(8, 'big')[:self.length]
+
+    def decode_columns(self, data: np.ndarray) -> dict[str, np.ndarray]:
+        """Decode every row of a payload matrix, value tables are left as raw numbers"""
+        return self.decode_words(*payload_words(data))
+
+    def decode_words(self, big: np.ndarray, little: np.ndarray) -> dict[str, np.ndarray]:
+        columns = {}
+        for spec in self.specs:
+            word = big if spec.big_endian else little
+            raw = (word >> np.uint64(spec.shift)) & np.uint64(spec.mask)
+            if spec.is_float:
+                if spec.length == 32:
+                    with np.errstate(invalid='ignore'):  # signalling NaN payloads
+                        value = raw.astype(np.uint32).view(np.float32).astype(np.float64)
+                else:
+                    value = raw.view(np.float64)
+            elif spec.sign_bit:
+                if spec.length == 64:
+                    value = raw.view(np.int64)
+                else:
+                    value = raw.astype(np.int64)
+                    value = np.where(value >= spec.sign_bit, value - (1 << spec.length), value)
+            else:
+                value = raw.astype(np.int64)
+            if not spec.identity:
+                value = value * spec.scale + spec.offset
+            columns[spec.name] = value
+        return columns
+
+
+class _CantoolsFrameDecoder:
+    """Frames the shift/mask table cannot express (multiplexed, containers, CAN FD) stay on cantools"""
+
+    def __init__(self, dbc_info, frame_id):
+        self._dbc_info = dbc_info
+        self._frame_id = frame_id
+        self.length = dbc_info.get_message_by_frame_id(frame_id).length
+
+    def subset(self, names):
+        return self
+
+    def decode(self, data: bytes) -> dict:
+        return self._dbc_info.decode_message(self._frame_id, data)
+
+    def decode_columns(self, data: np.ndarray) -> dict[str, np.ndarray]:
+        return self.decode_words(*payload_words(data))
+
+    def decode_words(self, big: np.ndarray, little: np.ndarray) -> dict[str, np.ndarray]:
+        payloads = np.asarray(big, dtype='>u8').tobytes()
+        rows = [self.decode(payloads[i:i + self.length]) for i in range(0, len(payloads), 8)]
+        names = rows[0].keys() if rows else []
+        return {name: np.array([float(row[name]) for row in rows]) for name in names}
+
+
+def payload_words(data: np.ndarray):
+    """Return the rows of an (n, <=8) uint8 payload matrix as big and little endian uint64 words"""
+    data = np.asarray(data, dtype=np.uint8)
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    if data.shape[1] != 8:
+        padded = np.zeros((data.shape[0], 8), dtype=np.uint8)
+        width = min(data.shape[1], 8)
+        padded[:, :width] = data[:, :width]
+        data = padded
+    data = np.ascontiguousarray(data)
+    big = data.view('>u8').reshape(-1).astype(np.uint64)
+    little = data.view('<u8').reshape(-1).astype(np.uint64)
+    return big, little
+
+
+def compile_frame(message):
+    """Build the FrameDecoder of a cantools message, or None if it needs cantools itself"""
+    if message.length > 8 or message.is_multiplexed() or getattr(message, 'is_container', False):
+        return None
+    return FrameDecoder([_dbc_spec(sig) for sig in message.signals], message.length)
+
+
+class SignalDecoder:
+    """Precompiled decoders for every DBC message plus the byte-wise fallback layout.
+
+    decode() returns the same dict as dbc_info.decode_message() for DBC frames; frames
+    missing from the DBC get one 8-bit signal per byte named by fallback_names(frame_id)."""
+
+    def __init__(self, dbc_info, fallback_names):
+        self._dbc_info = dbc_info
+        self._fallback_names = fallback_names
+        self._frames: dict[int, object] = {}
+        self._fallback: dict[int, FrameDecoder] = {}
+        for message in dbc_info.messages:
+            decoder = compile_frame(message)
+            if decoder is None:
+                decoder = _CantoolsFrameDecoder(dbc_info, message.frame_id)
+            self._frames[message.frame_id] = decoder
+
+    def frame(self, frame_id):
+        """Return the DBC frame decoder of frame_id, KeyError if the DBC does not know it"""
+        return self._frames[frame_id]
+
+    def fallback(self, frame_id) -> FrameDecoder:
+        decoder = self._fallback.get(frame_id)
+        if decoder is None:
+            names = self._fallback_names(frame_id)
+            decoder = FrameDecoder([_SignalSpec(name, False, start - 1, length)
+                                    for name, (start, length) in zip(names, BYTE_LAYOUT)])
+            self._fallback[frame_id] = decoder
+        return decoder
+
+    def decode(self, frame_id, data: bytes, dlc=8) -> dict:
+        decoder = self._frames.get(frame_id)
+        if decoder is None:
+            return self.decode_fallback(frame_id, data, dlc)
+        if len(data) < decoder.length:  # let cantools raise its DecodeError
+            return self._dbc_info.decode_message(frame_id, data)
+        return decoder.decode(data)
+
+    def decode_fallback(self, frame_id, data: bytes, dlc=8) -> dict:
+        decoder = self.fallback(frame_id)
+        info = {}
+        for ind, name in enumerate(decoder.names[:dlc]):
+            info[name] = data[ind]
+        return info
+
+    def decode_columns(self, frame_id, data: np.ndarray) -> dict[str, np.ndarray]:
+        decoder = self._frames.get(frame_id)
+        if decoder is None:
+            decoder = self.fallback(frame_id)
+        return decoder.decode_columns(data)
@@ -0,0 +1,237 @@
+import argparse
+import os
+import pickle
+import shutil
+from itertools import repeat
+import numpy as np
+
+from candump import BLOCK_SIZE, CanRecord, ColumnBlock, fields_to_batch, iter_fields, read_columns, read_records
+from file_cache import cache_path, file_digest, file_key, same_source
+
+TRACE_VERSION = 1
+TRACE_SUFFIX = '.trace'
+TRACE_MAGIC = b'KGIDTRC\x01'
+ALIGN = 64  # every column starts on a multiple of it
+
+# frame columns in file order: (name, dtype, values per frame)
+FRAME_COLUMNS = (('timestamp', np.float64, ()), ('id', np.uint32, ()), ('dlc', np.uint8, ()),
+                 ('length', np.uint8, ()), ('label', np.uint8, ()), ('data', np.uint8, (8,)))
+
+
+def trace_path(trace_dir, log_file):
+    return cache_path(trace_dir, log_file, TRACE_SUFFIX)
+
+
+def _column_base(header_size):
+    """File offset of the first column, after the magic, the header size and the header"""
+    return -(-(len(TRACE_MAGIC) + 8 + header_size) // ALIGN) * ALIGN
+
+
+def convert_trace(log_file, trace_file, block_size=BLOCK_SIZE):
+    """Write a candump log as memory mappable columns plus the index of its rows by CAN ID.
+
+    The columns are streamed to side files first, so the log is parsed once whatever its size."""
+    tmp_file = trace_file + '.tmp'
+    parts = {name: open(tmp_file + '.' + name, 'wb') for name, _, _ in FRAME_COLUMNS}
+    key = file_key(log_file)
+    n = 0
+    ascending = True
+    last_ts = -np.inf
+    try:
+        for ts, ids, data, labels in iter_fields(log_file):
+            for start in range(0, len(ts), block_size):
+                end = start + block_size
+                batch = fields_to_batch(ts[start:end], ids[start:end], data[start:end],
+                                        repeat(b'0', len(ts[start:end])) if labels is None else labels[start:end])
+                lengths = np.fromiter(map(len, data[start:end]), dtype=np.int64, count=len(batch)) // 2
+                ts_col = batch['timestamp']
+                ascending = ascending and ts_col[0] >= last_ts and bool(np.all(ts_col[1:] >= ts_col[:-1]))
+                last_ts = ts_col[-1]
+                for name, dtype, _ in FRAME_COLUMNS:
+                    col = np.minimum(lengths, 8) if name == 'length' else batch[name]
+                    parts[name].write(np.ascontiguousarray(col, dtype=dtype).tobytes())
+                n += len(batch)
+    finally:
+        for f in parts.values():
+            f.close()
+
+    # index: the rows of every CAN ID in time order, rows[offsets[k]:offsets[k + 1]] belong to ids[k]
+    id_col = np.fromfile(tmp_file + '.id', dtype=np.uint32)
+    rows = np.argsort(id_col, kind='stable').astype(np.uint32 if n < 1 << 32 else np.uint64)
+    index_ids, counts = np.unique(id_col, return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.uint64)
+    index = {'index_ids': index_ids.astype(np.uint32), 'index_offsets': offsets, 'index_rows': rows}
+    del id_col
+
+    columns = {}
+    position = 0
+    for name, dtype, shape in FRAME_COLUMNS:
+        columns[name] = (np.dtype(dtype).str, (n,) + shape, position)
+        position += -(-n * np.dtype(dtype).itemsize * int(np.prod(shape)) // ALIGN) * ALIGN
+    for name, arr in index.items():
+        columns[name] = (arr.dtype.str, arr.shape, position)
+        position += -(-arr.nbytes // ALIGN) * ALIGN
+    header = {'version': TRACE_VERSION, 'digest': file_digest(log_file), 'frames': n, 'ascending': ascending,
+              'columns': columns}
+    header.update(key)
+    blob = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+    base = _column_base(len(blob))
+
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(TRACE_MAGIC)
+            f.write(len(blob).to_bytes(8, 'little'))
+            f.write(blob)
+            for name, _, _ in FRAME_COLUMNS:
+                f.seek(base + columns[name][2])
+                with open(tmp_file + '.' + name, 'rb') as part:
+                    shutil.copyfileobj(part, f, 1 << 20)
+            for name, arr in index.items():
+                f.seek(base + columns[name][2])
+                f.write(arr.tobytes())
+            f.truncate(base + position)
+        os.replace(tmp_file, trace_file)  # readers never see a half written trace
+    finally:
+        for name, _, _ in FRAME_COLUMNS:
+            os.remove(tmp_file + '.' + name)
+    return trace_file
+
+
+def _read_header(trace_file):
+    with open(trace_file, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            return None
+        size = int.from_bytes(f.read(8), 'little')
+        header = pickle.loads(f.read(size))
+    header['base'] = _column_base(size)
+    return header
+
+
+class TraceCache:
+    """Read only, memory mapped columns of a converted candump log.
+
+    Slices of consecutive rows, a time range of an ascending log included, are views of
+    the file; the rows of one CAN ID come from the index written by convert_trace()."""
+
+    def __init__(self, trace_file, header=None):
+        self.trace_file = trace_file
+        header = header or _read_header(trace_file)
+        self.frames = header['frames']
+        self.ascending = header['ascending']
+        base = header['base']
+        columns = {}
+        for name, (dtype, shape, offset) in header['columns'].items():
+            if int(np.prod(shape)) == 0:  # empty columns can not be mapped
+                columns[name] = np.empty(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(trace_file, dtype=dtype, mode='r', offset=base + offset, shape=shape)
+        self.timestamps = columns['timestamp']
+        self.ids = columns['id']
+        self.dlc = columns['dlc']
+        self.lengths = columns['length']  # payload bytes of the log line, data is zero padded to 8
+        self.labels = columns['label']
+        self.data = columns['data']
+        self._index_ids = columns['index_ids']
+        self._index_offsets = columns['index_offsets']
+        self._index_rows = columns['index_rows']
+
+    def __len__(self):
+        return self.frames
+
+    def words(self):
+        """Payloads as big endian uint64, a view of the data column"""
+        return self.data.view('>u8').reshape(-1)
+
+    def block(self, rows):
+        """ColumnBlock of a slice (views) or an array of row numbers (copies)"""
+        return ColumnBlock(self.ids[rows], self.data[rows], self.dlc[rows], self.timestamps[rows], self.labels[rows])
+
+    def blocks(self, block_size=BLOCK_SIZE):
+        """ColumnBlocks of consecutive rows, the read_columns() of the log without parsing it"""
+        for start in range(0, self.frames, block_size):
+            yield self.block(slice(start, start + block_size))
+
+    def time_rows(self, start, end):
+        """Rows with start <= timestamp < end, a slice if the log is in time order"""
+        if self.ascending:
+            return slice(*np.searchsorted(self.timestamps, [start, end]).tolist())
+        ts = self.timestamps
+        return np.flatnonzero((ts >= start) & (ts < end))
+
+    def id_rows(self, f_id):
+        """Row numbers of every frame of a CAN ID, in time order"""
+        k = int(np.searchsorted(self._index_ids, f_id))
+        if k == len(self._index_ids) or self._index_ids[k] != f_id:
+            return self._index_rows[:0]
+        return self._index_rows[int(self._index_offsets[k]):int(self._index_offsets[k + 1])]
+
+    def id_counts(self):
+        """{CAN ID: frames}"""
+        return dict(zip(self._index_ids.tolist(), np.diff(self._index_offsets).tolist()))
+
+    def time_slice(self, start, end):
+        return self.block(self.time_rows(start, end))
+
+    def id_slice(self, f_id):
+        return self.block(self.id_rows(f_id))
+
+    def records(self, block_size=BLOCK_SIZE):
+        """Yield the CanRecord of every frame, as read_records() of the log does"""
+        for start in range(0, self.frames, block_size):
+            rows = slice(start, start + block_size)
+            data = self.data[rows].tobytes()
+            lengths = self.lengths[rows].tolist()
+            payloads = (data[8 * i:8 * i + k] for i, k in enumerate(lengths))
+            normals = map((0).__eq__, self.labels[rows].tolist())
+            records = zip(self.timestamps[rows].tolist(), self.ids[rows].tolist(), self.dlc[rows].tolist(),
+                          payloads, normals)
+            yield from map(tuple.__new__, repeat(CanRecord), records)
+
+
+def open_trace(log_file, trace_dir):
+    """Return the TraceCache of a log, or None if it is missing or stale"""
+    trace_file = trace_path(trace_dir, log_file)
+    try:
+        key = file_key(log_file)
+        header = _read_header(trace_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+        return None
+    if header is None or header.get('version') != TRACE_VERSION or not same_source(header, key, log_file):
+        return None
+    return TraceCache(trace_file, header)
+
+
+def load_trace(log_file, trace_dir):
+    """TraceCache of a log, converting it first if needed; None if the trace can't be written"""
+    trace = open_trace(log_file, trace_dir)
+    if trace is not None:
+        return trace
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+        return TraceCache(convert_trace(log_file, trace_path(trace_dir, log_file)))
+    except OSError:
+        print("Can't write trace cache!")
+        return None
+
+
+def cached_records(log_file, trace_dir=None):
+    """read_records() of a log, from its trace in trace_dir when there is one"""
+    trace = load_trace(log_file, trace_dir) if trace_dir else None
+    return read_records(log_file) if trace is None else trace.records()
+
+
+def cached_columns(log_file, block_size=BLOCK_SIZE, trace_dir=None):
+    """read_columns() of a log, from its trace in trace_dir when there is one"""
+    trace = load_trace(log_file, trace_dir) if trace_dir else None
+    return read_columns(log_file, block_size) if trace is None else trace.blocks(block_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert candump logs to memory mapped columnar traces')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--dir', default=r'../../data/traces')
+    args = parser.parse_args()
+    for log in args.logs:
+        trace = load_trace(log, args.dir)
+        if trace is not None:
+            print('%s: %d frames, %d IDs -> %s' % (log, len(trace), len(trace.id_counts()), trace.trace_file))
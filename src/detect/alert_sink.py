@@ -0,0 +1,170 @@
+import csv
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+FORMATS = ('jsonl', 'csv', 'bin')
+BIN_RECORD = struct.Struct('<dIBB')  # timestamp, id, code, signal name length, then the utf-8 name
+
+
+class Alert(NamedTuple):
+    timestamp: float
+    id: int
+    code: int  # ERROR_*
+    signal: str = None  # offending signal of ERROR_SIGNAL_INFO/ERROR_SIGNAL_RELATION
+
+
+def _write_jsonl(f, batch):
+    f.write(''.join('{"timestamp": %r, "id": %d, "code": %d, "signal": %s}\n' % (
+        a.timestamp, a.id, a.code, json.dumps(a.signal)) for a in batch))
+
+
+def _write_csv(f, batch):
+    csv.writer(f).writerows((a.timestamp, a.id, a.code, a.signal or '') for a in batch)
+
+
+def _write_bin(f, batch):
+    out = bytearray()
+    for a in batch:
+        name = (a.signal or '').encode()[:255]
+        out += BIN_RECORD.pack(a.timestamp, a.id, a.code, len(name))
+        out += name
+    f.write(out)
+
+
+def read_bin(fileName):
+    """Yield the Alerts of a binary alert file"""
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    pos = 0
+    while pos < len(data):
+        ts, f_id, code, length = BIN_RECORD.unpack_from(data, pos)
+        pos += BIN_RECORD.size
+        name = data[pos:pos + length].decode() or None
+        pos += length
+        yield Alert(ts, f_id, code, name)
+
+
+class AlertSink:
+    """Buffers alerts in memory and appends them in batches from a background writer thread.
+
+    An alert repeating the (id, code) of one emitted less than dedup_window seconds
+    of capture time earlier is only counted in `suppressed`. A partial batch is written
+    by the writer thread once it is flush_interval seconds old; at most max_batches wait
+    for the writer, then emit() blocks until the disk catches up."""
+
+    def __init__(self, fileName, fmt=None, batch_size=4096, flush_interval=1.0, dedup_window=1.0, max_batches=64):
+        fmt = fmt or os.path.splitext(fileName)[1].lstrip('.')
+        if fmt not in FORMATS:
+            raise ValueError('unknown alert format: %s' % fmt)
+        self.fileName = fileName
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+        self.emitted = 0
+        self.suppressed = 0
+        self._write = {'jsonl': _write_jsonl, 'csv': _write_csv, 'bin': _write_bin}[fmt]
+        if fmt == 'bin':
+            self._file = open(fileName, 'wb')
+        else:
+            self._file = open(fileName, 'w', encoding='utf-8', newline='')
+        if fmt == 'csv':
+            csv.writer(self._file).writerow(Alert._fields)
+        self._buffer: list[Alert] = []
+        self._last: dict[tuple[int, int], float] = {}  # (id, code): timestamp of the last emitted alert
+        self._oldest = None  # monotonic time the first buffered alert came in
+        # held while the buffer is taken and queued, so batches reach the file in emit order
+        self._lock = threading.Lock()
+        self._batches = queue.Queue(max_batches)
+        self._error = None  # exception that stopped the writer thread
+        self._writer = threading.Thread(target=self._run, name='alert-writer', daemon=True)
+        self._writer.start()
+
+    def emit(self, timestamp, f_id, code, signal=None):
+        key = (f_id, code)
+        last = self._last.get(key)
+        if last is not None and timestamp - last < self.dedup_window:
+            self.suppressed += 1
+            return
+        self._last[key] = timestamp
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(Alert(timestamp, f_id, code, signal))
+            self.emitted += 1
+            if len(self._buffer) >= self.batch_size:
+                self._queue_buffer()
+
+    def flush(self):
+        """Hand the buffered alerts to the writer thread"""
+        with self._lock:
+            self._queue_buffer()
+
+    def _queue_buffer(self):
+        if self._error is not None:
+            raise RuntimeError('alert writer failed') from self._error
+        if self._buffer:
+            self._batches.put(self._buffer)  # blocks while max_batches are waiting
+            self._buffer = []
+
+    def close(self):
+        try:
+            if self._error is None:
+                self.flush()
+        finally:
+            self._batches.put(None)
+            self._writer.join()
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def _take_stale(self):
+        """Queued batches plus the buffer once its oldest alert is due, None when nothing is"""
+        if not self._lock.acquire(blocking=False):  # emit() is queueing a batch, get() will see it
+            return None
+        try:
+            # polled every flush_interval / 4, so no alert waits longer than flush_interval
+            if not self._buffer or time.monotonic() - self._oldest < 0.75 * self.flush_interval:
+                return None
+            batches = []
+            while not self._batches.empty():
+                batches.append(self._batches.get_nowait())
+            batches.append(self._buffer)
+            self._buffer = []
+            return batches
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        while True:
+            try:
+                batches = [self._batches.get(timeout=self.flush_interval / 4)]
+            except queue.Empty:
+                batches = self._take_stale()
+                if batches is None:
+                    continue
+            done = None in batches
+            try:
+                if self._error is None:
+                    for batch in batches:
+                        if batch is not None:
+                            self._write(self._file, batch)
+                    if self._batches.empty():
+                        self._file.flush()
+            except Exception as e:  # keep draining so emit() never blocks, close() raises it
+                self._error = e
+            if done:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __str__(self):
+        return 'AlertSink %s: %d alerts, %d duplicates suppressed' % (self.fileName, self.emitted, self.suppressed)
@@ -0,0 +1,231 @@
+import numpy as np
+from signal_decoder import payload_words
+from type import *
+from frame_rule import ROUND_EPS, FrameRule, SignalIndex, relation_targets
+
+_SIGNAL_CHECKED = 1  # passed dlc, bit pattern, first signal range and value change rate
+_REACH_INTERVAL = 2  # passed every check before the time interval
+
+
+def messages_to_columns(msgs: list[Msg]):
+    """Pack Msg objects into the (id, data, dlc, timestamp) columns taken by BatchDetector"""
+    n = len(msgs)
+    ids = np.fromiter((m.id for m in msgs), dtype=np.uint32, count=n)
+    dlc = np.fromiter((m.dlc for m in msgs), dtype=np.uint8, count=n)
+    ts = np.fromiter((m.timestamp for m in msgs), dtype=np.float64, count=n)
+    data = np.zeros((n, 8), dtype=np.uint8)
+    for i, m in enumerate(msgs):
+        data[i, :len(m.data)] = np.frombuffer(m.data, dtype=np.uint8, count=min(len(m.data), 8))
+    return ids, data, dlc, ts
+
+
+def _round_outside(values, minVal, maxVal):
+    """Vectorized round(x, 4) < minVal or round(x, 4) > maxVal"""
+    if values.dtype.kind in 'iu':
+        return (values < minVal) | (values > maxVal)
+    out = (values < minVal - ROUND_EPS) | (values > maxVal + ROUND_EPS)
+    near = np.flatnonzero(~out & ~((values >= minVal + ROUND_EPS) & (values <= maxVal - ROUND_EPS)))
+    if len(near):
+        # values next to a bound are mostly the bound itself, round() each distinct one once
+        distinct, inverse = np.unique(values[near], return_inverse=True)
+        rounded = [round(v, 4) for v in distinct.tolist()]
+        out[near] = np.array([v < minVal or v > maxVal for v in rounded], dtype=bool)[inverse]
+    return out
+
+
+def _rate_outside(value, last, max_rate, maxVal):
+    """Vectorized value change rate check of match_feature()"""
+    if maxVal:
+        max_possible = (last + max_rate) % maxVal
+        min_possible = (last - max_rate + maxVal) % maxVal
+    else:
+        max_possible = last + max_rate
+        min_possible = last - max_rate
+    return (np.abs(value - last) > max_rate) & (max_possible < value) & (value < min_possible)
+
+
+class _FrameRule(FrameRule):
+    def __init__(self, frame: FrameInfo, signal_decoder, alpha, targets, index: SignalIndex):
+        super().__init__(frame, alpha, targets, index)
+        try:
+            decoder = signal_decoder.frame(frame.id)
+        except KeyError:
+            decoder = signal_decoder.fallback(frame.id)
+        self.decoder = decoder.subset(self.names)
+
+        # signals whose processing touches the shared relation state
+        self.rel_rows = [(j, sig, watched, up, down) for j, (sig, watched, up, down)
+                         in enumerate(zip(self.sig_ids, self.watched, self.up, self.down)) if watched or up or down]
+
+    def decode(self, big, little):
+        columns = self.decoder.decode_words(big, little)
+        return [columns[name] for name in self.names]
+
+
+class BatchDetector:
+    """Column-wise counterpart of match_feature() over blocks of messages.
+
+    Detection state carries over between calls, so a capture can be fed block by
+    block and the result codes equal the per-message path message for message.
+    Relation bookkeeping crosses IDs and is replayed in message order, so frames
+    with relations still cost Python work per message."""
+
+    def __init__(self, graph_info: dict[int, FrameInfo], signal_decoder, alpha=0.05):
+        self.graph_info = graph_info
+        self.signal_decoder = signal_decoder
+        self.alpha = alpha
+        self._rules: dict[int, _FrameRule] = {}
+        self._targets = relation_targets(graph_info)
+        self._index = SignalIndex()
+        self.last_value: dict[int, float] = {}  # first signal value of the last rate checked message
+        self.last_appear_time: dict[int, float] = {}
+        self.signal_relation: list = []  # expected direction by signal id, None when no relation is pending
+
+    def _rule(self, f_id):
+        rule = self._rules.get(f_id)
+        if rule is None:
+            rule = _FrameRule(self.graph_info[f_id], self.signal_decoder, self.alpha, self._targets, self._index)
+            self._rules[f_id] = rule
+            self.signal_relation.extend([None] * (len(self._index.signals) - len(self.signal_relation)))
+        return rule
+
+    def detect(self, ids, data, dlc, timestamps):
+        """Return the match_feature() result code of every message in the block"""
+        ids = np.asarray(ids)
+        dlc = np.asarray(dlc)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(ids)
+        codes = np.full(n, NORMAL, dtype=np.uint8)
+        if n == 0:
+            return codes
+        big, little = payload_words(data)
+        stage = np.zeros(n, dtype=np.uint8)
+        first_bad = np.zeros(n, dtype=np.int64)  # first signal after the first one out of range
+        rate0 = np.zeros(n, dtype=np.float64)
+
+        # one stable sort groups the rows by id, each group in message order
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1])))
+        bounds = np.append(starts[1:], n)
+        groups = []
+        for u, start, end in zip(sorted_ids[starts].tolist(), starts.tolist(), bounds.tolist()):
+            idx = order[start:end]
+            if u not in self.graph_info:
+                codes[idx] = ERROR_NOT_FOUND_ID
+                continue
+            rule = self._rule(u)
+            groups.append((u, rule, idx))
+            self._check_frame(u, rule, idx, big, little, dlc, codes, stage, first_bad, rate0)
+
+        if self._targets:
+            self._check_relation(groups, ids, codes, stage, first_bad, rate0)
+
+        for u, rule, idx in groups:
+            self._check_interval(u, rule, idx, timestamps, codes, stage)
+        return codes
+
+    def _check_frame(self, f_id, rule, idx, big, little, dlc, codes, stage, first_bad, rate0):
+        frame = rule.frame
+        ok = dlc[idx] == frame.dlc
+        codes[idx[~ok]] = ERROR_DLC
+        bits_ok = (big[idx] & np.uint64(rule.bits_mask)) == np.uint64(rule.bits_val)
+        codes[idx[ok & ~bits_ok]] = ERROR_BIT_PATTERN
+        idx = idx[ok & bits_ok]
+        if len(idx) == 0:
+            return
+        if not rule.names:
+            stage[idx] = _REACH_INTERVAL
+            return
+
+        columns = rule.decode(big[idx], little[idx])
+        value = columns[0]
+        bad = _round_outside(value, rule.min_vals[0], rule.max_vals[0])
+        codes[idx[bad]] = ERROR_SIGNAL_INFO
+        idx, value = idx[~bad], value[~bad]
+        columns = [c[~bad] for c in columns]
+        if len(idx) == 0:
+            return
+
+        # the first message of an id only records its values
+        new_last = value[-1]
+        if f_id in self.last_value:
+            last = np.concatenate(([self.last_value[f_id]], value[:-1]))
+        else:
+            last = value[:-1]
+            idx, value = idx[1:], value[1:]
+            columns = [c[1:] for c in columns]
+        self.last_value[f_id] = new_last
+        if len(idx) == 0:
+            return
+        rate = value - last
+        bad = _rate_outside(value, last, rule.rates[0], rule.max_vals[0])
+        codes[idx[bad]] = ERROR_SIGNAL_INFO
+        keep = ~bad
+        idx, rate = idx[keep], rate[keep]
+        columns = [c[keep] for c in columns]
+
+        stop = np.full(len(idx), len(rule.names), dtype=np.int64)
+        for j in range(len(rule.names) - 1, 0, -1):
+            bad = _round_outside(columns[j], rule.min_vals[j], rule.max_vals[j])
+            if rule.rates[j] < 0:  # later signals have a zero change, which only a negative rate rejects
+                bad |= _rate_outside(columns[j], columns[j], rule.rates[j], rule.max_vals[j])
+            stop[bad] = j
+        stage[idx] = _SIGNAL_CHECKED
+        first_bad[idx] = stop
+        rate0[idx] = rate
+        failed = stop < len(rule.names)
+        codes[idx[failed]] = ERROR_SIGNAL_INFO
+        stage[idx[~failed]] = _REACH_INTERVAL
+
+    def _check_relation(self, groups, ids, codes, stage, first_bad, rate0):
+        """Replay the relation bookkeeping in message order for frames that take part in it"""
+        involved = [idx for _, rule, idx in groups if rule.rel_rows]
+        if not involved:
+            return
+        pending = np.concatenate(involved)
+        pending = np.sort(pending[stage[pending] != 0])
+        signal_relation = self.signal_relation
+        rel_rows = {f_id: rule.rel_rows for f_id, rule, _ in groups}
+        rejected = []
+        for k, f_id, stop, rate in zip(pending.tolist(), ids[pending].tolist(),
+                                       first_bad[pending].tolist(), rate0[pending].tolist()):
+            for j, sig, watched, up, down in rel_rows[f_id]:
+                if j >= stop:
+                    break
+                r = rate if j == 0 else 0
+                if watched:
+                    cor = signal_relation[sig]
+                    if cor is not None:
+                        signal_relation[sig] = None
+                        if r < 0 if cor else r > 0:
+                            rejected.append(k)
+                            break
+                if up:
+                    rising = r > 0
+                    for target in up:
+                        signal_relation[target] = rising
+                if down:
+                    falling = r < 0
+                    for target in down:
+                        signal_relation[target] = falling
+        codes[rejected] = ERROR_SIGNAL_RELATION
+        stage[rejected] = 0
+
+    def _check_interval(self, f_id, rule, idx, timestamps, codes, stage):
+        idx = idx[stage[idx] == _REACH_INTERVAL]
+        if len(idx) == 0:
+            return
+        ts = timestamps[idx]
+        frame = rule.frame
+        if f_id not in self.last_appear_time:
+            self.last_appear_time[f_id] = ts[0]
+            idx, ts = idx[1:], ts[1:]
+        if not frame.isCycle or len(idx) == 0:
+            return
+        last = np.concatenate(([self.last_appear_time[f_id]], ts[:-1]))
+        self.last_appear_time[f_id] = ts[-1]
+        period = frame.period
+        maxTs = last + period + period * self.alpha + frame.jitter_max
+        minTs = last + period - period * self.alpha + frame.jitter_min
+        codes[idx[(ts < minTs) | (maxTs < ts)]] = ERROR_INTERVAL
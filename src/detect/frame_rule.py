@@ -0,0 +1,132 @@
+from type import *
+
+ROUND_EPS = 1e-4  # values further than this inside a bound keep their side after round(x, 4)
+TS_SLACK = 1e-5  # covers the rounding of last_ts + period + ... for timestamps up to ~1e10 s
+
+
+class SignalIndex:
+    """Dense integer ids of signal names, and slots of CAN IDs, handed out as rules are compiled.
+
+    Ids are only ever added, so the arrays of a DetectState stay valid across KG reloads;
+    epoch grows with every new id."""
+
+    def __init__(self):
+        self.signals: dict[str, int] = {}
+        self.frames: dict[int, int] = {}
+
+    def signal(self, name):
+        sig = self.signals.get(name)
+        if sig is None:
+            sig = self.signals[name] = len(self.signals)
+        return sig
+
+    def frame(self, f_id):
+        slot = self.frames.get(f_id)
+        if slot is None:
+            slot = self.frames[f_id] = len(self.frames)
+        return slot
+
+    @property
+    def epoch(self):
+        return len(self.signals) + len(self.frames)
+
+
+class FrameRule:
+    """Flat, precompiled form of one FrameInfo as checked by match_feature().
+
+    bits_mask/bits_val hold the fixed bits of the 8-byte payload read as one
+    big endian integer; per signal columns are tuples in KG signal order and
+    rows zips them for the per-message loop. Signals are also known by their
+    SignalIndex id, up/down list the ids a signal expects to rise with it or
+    against it."""
+
+    def __init__(self, frame: FrameInfo, alpha, targets=(), index: SignalIndex = None):
+        if index is None:
+            index = SignalIndex()
+        self.frame = frame
+        self.id = frame.id
+        self.dlc = frame.dlc
+        self.slot = index.frame(frame.id)  # of the last value in DetectState
+
+        # examine fix values
+        self.bit_bytes = tuple((byte, item.bits, item.val) for byte, item in frame.bit_pattern.items())
+        self.bits_mask = 0
+        self.bits_val = 0
+        self.word_len = 8  # payload length checked with the mask, others go through match_bytes()
+        never = False
+        for byte, bits, val in self.bit_bytes:
+            if not 0 <= byte < 8:
+                self.word_len = -1
+            elif not 0 <= val <= 0xff:  # never equal to a masked payload byte
+                never = True
+            else:
+                shift = 8 * (7 - byte)
+                self.bits_mask |= (bits & 0xff) << shift
+                self.bits_val |= val << shift
+        if never:
+            self.bits_mask, self.bits_val = 0, 1
+
+        # examine signal
+        signals = frame.signals.values()
+        self.names = tuple(frame.signals.keys())
+        self.min_vals = tuple(signal.minVal for signal in signals)
+        self.max_vals = tuple(signal.maxVal for signal in signals)
+        self.rates = tuple(signal.rate for signal in signals)
+        self.inner_min = tuple(v + ROUND_EPS for v in self.min_vals)
+        self.inner_max = tuple(v - ROUND_EPS for v in self.max_vals)
+        self.watched = tuple(name in targets for name in self.names)
+        self.rels = tuple(tuple((r.targetSignal, r.type) for r in signal.rel) for signal in signals)
+        self.sig_ids = tuple(index.signal(name) for name in self.names)
+        up, down = [], []
+        for rels in self.rels:
+            forward = {}  # the last relation to a target wins, as it did with names
+            for target, cor in rels:
+                forward[index.signal(target)] = cor
+            up.append(tuple(sig for sig, cor in forward.items() if cor))
+            down.append(tuple(sig for sig, cor in forward.items() if not cor))
+        self.up = tuple(up)
+        self.down = tuple(down)
+        self.rows = tuple(zip(self.names, self.sig_ids, self.inner_min, self.inner_max, self.min_vals, self.max_vals,
+                              self.rates, self.watched, self.up, self.down))
+        self.epoch = index.epoch  # a DetectState fitted to this epoch has room for every id above
+        self.related = any(self.watched) or any(self.up) or any(self.down)  # takes part in relation checks
+
+        # examine time interval
+        self.is_cycle = frame.isCycle
+        self.alpha = alpha
+        self.min_gap = frame.period - frame.period * alpha + frame.jitter_min
+        self.max_gap = frame.period + frame.period * alpha + frame.jitter_max
+        self.inner_min_gap = self.min_gap + TS_SLACK
+        self.inner_max_gap = self.max_gap - TS_SLACK
+
+    def match_data(self, data: bytes):
+        """Fixed bit check of a payload, one masked compare when it is 8 bytes long"""
+        if len(data) == self.word_len:
+            return int.from_bytes(data, 'big') & self.bits_mask == self.bits_val
+        return self.match_bytes(data)
+
+    def match_bytes(self, data: bytes):
+        """Byte-wise fixed bit check for payloads that are not exactly 8 bytes long"""
+        for byte, bits, val in self.bit_bytes:
+            if bits & data[byte] != val:
+                return False
+        return True
+
+    def interval_error(self, last_ts, msg_ts):
+        """Exact bound check for a gap within TS_SLACK of min_gap/max_gap"""
+        frame = self.frame
+        maxTs = last_ts + frame.period + frame.period * self.alpha + frame.jitter_max
+        minTs = last_ts + frame.period - frame.period * self.alpha + frame.jitter_min
+        return msg_ts < minTs or maxTs < msg_ts
+
+
+def relation_targets(graph_info: dict[int, FrameInfo]):
+    """Names of the signals some relation of the KG points at"""
+    return {r.targetSignal for frame in graph_info.values()
+            for signal in frame.signals.values() for r in signal.rel}
+
+
+def compile_rules(graph_info: dict[int, FrameInfo], alpha, index: SignalIndex = None) -> dict[int, FrameRule]:
+    targets = relation_targets(graph_info)
+    index = SignalIndex() if index is None else index
+    return {f_id: FrameRule(frame, alpha, targets, index) for f_id, frame in graph_info.items()}
@@ -0,0 +1,148 @@
+import gc
+import os
+import threading
+import traceback
+from time import perf_counter_ns
+
+import detect
+from process_pool import pool_context
+from frame_rule import compile_rules, relation_targets
+from kg_snapshot import load_snapshot, same_frame, snapshot_path
+from type import *
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class KGReloader:
+    """Watches the KG file and its snapshot, and rebuilds the detection rules in a background thread.
+
+    A change is picked up once the files stayed the same for one poll interval, so a KG
+    still being written is not read. The build (parsing in a child process, loading the
+    snapshot, compiling the rules and diffing them against the running KG) never blocks
+    detection for long; the detection loop calls poll()
+    between two messages, which swaps the new rules in and drops the per-ID state of the
+    frames whose rules changed. The time poll() takes is the pause of the loop."""
+
+    def __init__(self, kg_file, interval=1.0):
+        self.kg_file = kg_file
+        self.interval = interval
+        self._loaded = self._stamp()
+        self._seen = self._loaded
+        self._pending = None  # (graph_info, frame_rules, changed ids, their slots, stale signal ids) of a finished build
+        self._retired = None  # KG replaced by poll(), freed by the watcher instead of the detection loop
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.changed = 0  # frames whose state was dropped, over all reloads
+        self.build_ns = 0  # last background build
+        self.last_pause_ns = 0
+        self.max_pause_ns = 0
+
+    def _stamp(self):
+        return _file_stamp(self.kg_file), _file_stamp(snapshot_path(self.kg_file))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, name='kg-reload', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Start a build if the KG changed and settled since the last check, return True if one ran"""
+        self._retired = None
+        if self._pending is not None:  # the last build is not swapped in yet
+            return False
+        stamp = self._stamp()
+        settled = stamp == self._seen
+        self._seen = stamp
+        if not settled or stamp == self._loaded or stamp[0] is None:
+            return False
+        try:
+            self._pending = self.build()
+        except Exception:  # keep detecting with the old KG, a later write of the file retries
+            traceback.print_exc()
+        self._loaded = self._seen = stamp[0], self._stamp()[1]  # a snapshot written by the build is not a change
+        return True
+
+    def build(self):
+        """New graph_info and rules from the KG file, with what poll() must forget of the old ones"""
+        start = perf_counter_ns()
+        old = detect.graph_info
+        if load_snapshot(self.kg_file) is None:
+            # parsing turtle holds the GIL in long stretches and leaves much cyclic garbage,
+            # a child process does it and writes the snapshot read below
+            child = pool_context().Process(target=detect.read_kg, args=(self.kg_file,))
+            child.start()
+            child.join()
+            if child.exitcode != 0:  # not parsed again here, check() keeps the old KG
+                raise RuntimeError('parsing %s failed, exit code %s' % (self.kg_file, child.exitcode))
+        # gc.disable() is process-wide: the detection loop collects nothing during the build either,
+        # instead of running the collections the build's allocations trigger; the first one after
+        # gc.enable() still runs in whichever thread allocates next
+        gc.disable()
+        try:
+            frames = detect.read_kg(self.kg_file)
+            rules = compile_rules(frames, detect.alpha, detect.SIGNAL_INDEX)
+        finally:
+            gc.enable()
+        changed = {f_id for f_id, frame in frames.items() if f_id not in old or not same_frame(old[f_id], frame)}
+        changed.update(f_id for f_id in old if f_id not in frames)
+        # pending relation checks go when the target or the source signal changed, or nothing points at it anymore
+        stale = relation_targets(old) - relation_targets(frames)
+        for f_id in changed:
+            for frame in (old.get(f_id), frames.get(f_id)):
+                if frame is not None:
+                    stale.update(frame.signals)
+                    stale.update(r.targetSignal for signal in frame.signals.values() for r in signal.rel)
+        index = detect.SIGNAL_INDEX
+        slots = [index.frames[f_id] for f_id in changed if f_id in index.frames]
+        stale = [index.signals[name] for name in stale if name in index.signals]
+        self.build_ns = perf_counter_ns() - start
+        return frames, rules, changed, slots, stale
+
+    def poll(self, state: DetectState):
+        """Swap in a finished build, carrying state over for the unchanged frames; True if the KG changed"""
+        pending = self._pending
+        if pending is None:
+            return False
+        start = perf_counter_ns()
+        frames, rules, changed, slots, stale = pending
+        self._retired = detect.graph_info, detect.frame_rules
+        detect.swap_graph(frames, rules)
+        for f_id in changed:
+            state.last_appear_time.pop(f_id, None)
+        # ids past the end of the lists are unseen yet, match_feature() grows them with None
+        last_value = state.last_value
+        for slot in slots:
+            if slot < len(last_value):
+                last_value[slot] = None
+        signal_relation = state.signal_relation
+        for sig in stale:
+            if sig < len(signal_relation):
+                signal_relation[sig] = None
+        self._pending = None
+        pause = perf_counter_ns() - start
+        self.last_pause_ns = pause
+        self.max_pause_ns = max(self.max_pause_ns, pause)
+        self.reloads += 1
+        self.changed += len(changed)
+        return True
+
+    def __str__(self):
+        return 'KG reloads %d, frames changed %d, last build %.1fms, max pause %.1fus' % (
+            self.reloads, self.changed, self.build_ns / 1e6, self.max_pause_ns / 1e3)
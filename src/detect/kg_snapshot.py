@@ -0,0 +1,75 @@
+import os
+import pickle
+from file_cache import file_digest
+from type import *
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snap'
+
+
+def snapshot_path(kg_file):
+    return kg_file + SNAPSHOT_SUFFIX
+
+
+def _pack_frame(frame: FrameInfo):
+    bits = [(byte, p.bits, p.val) for byte, p in frame.bit_pattern.items()]
+    signals = []
+    for name, sig in frame.signals.items():
+        rels = [(r.targetID, r.targetSignal, r.type) for r in sig.rel]
+        signals.append((name, sig.maxVal, sig.minVal, sig.rate, rels))
+    return (frame.id, frame.dlc, frame.isCycle, frame.period,
+            frame.jitter_min, frame.jitter_max, bits, signals)
+
+
+def _unpack_frame(record):
+    f_id, dlc, is_cycle, period, jitter_min, jitter_max, bits, signals = record
+    frame = FrameInfo(f_id)
+    frame.dlc = dlc
+    frame.isCycle = is_cycle
+    frame.period = period
+    frame.jitter_min = jitter_min
+    frame.jitter_max = jitter_max
+    for byte, b, val in bits:
+        frame.bit_pattern[byte] = bitPattern(b, val)
+    for name, maxVal, minVal, rate, rels in signals:
+        sig = Signal(maxVal, minVal, rate)
+        sig.rel = [Relation(t_id, t_sig, cor) for t_id, t_sig, cor in rels]
+        frame.signals[name] = sig
+    return frame
+
+
+def same_frame(a: FrameInfo, b: FrameInfo):
+    """True when both frames hold the same KG knowledge, and so compile to the same rule"""
+    return _pack_frame(a) == _pack_frame(b)
+
+
+def save_snapshot(graph_info: dict[int, FrameInfo], kg_file, snap_file=None):
+    """Write graph_info as a compiled snapshot bound to the checksum of kg_file"""
+    snap_file = snap_file or snapshot_path(kg_file)
+    header = {'version': SNAPSHOT_VERSION, 'source': file_digest(kg_file)}
+    frames = [_pack_frame(frame) for frame in graph_info.values()]
+    tmp_file = snap_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, snap_file)  # readers never see a half written snapshot
+
+
+def load_snapshot(kg_file, snap_file=None):
+    """Return graph_info from the snapshot, or None if it is missing or stale"""
+    snap_file = snap_file or snapshot_path(kg_file)
+    try:
+        with open(snap_file, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('version') != SNAPSHOT_VERSION:
+                return None
+            if header.get('source') != file_digest(kg_file):
+                return None
+            frames = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+        return None
+    graph_info: dict[int, FrameInfo] = {}
+    for record in frames:
+        frame = _unpack_frame(record)
+        graph_info[frame.id] = frame
+    return graph_info
@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import sys
+import time
+from array import array
+
+import detect
+from alert_sink import AlertSink
+from candump import parse_record
+from kg_reload import KGReloader
+from type import *
+
+POLICIES = ('block', 'drop', 'drop-oldest')  # what a full queue does with a new frame
+YIELD_EVERY = 256  # frames the consumer handles before letting the readers run
+
+
+class LatencyStats:
+    """Arrival to verdict latency, percentiles over the last `size` frames"""
+
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.samples = array('d', bytes(8 * size))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.samples[self.count % self.size] = latency
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+
+    def percentile(self, q):
+        n = min(self.count, self.size)
+        if n == 0:
+            return 0.0
+        window = sorted(self.samples[:n])
+        return window[min(n - 1, int(q / 100 * n))]
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0.0
+        return 'latency: mean %.1fus p50 %.1fus p99 %.1fus max %.1fus' % (
+            1e6 * mean, 1e6 * self.percentile(50), 1e6 * self.percentile(99), 1e6 * self.max)
+
+
+class LiveDetector:
+    """Runs decode_message()/match_feature() over frames pushed by stream readers.
+
+    Frames wait in a bounded queue; when it is full the reader either blocks, which
+    backs up the pipe or socket (block), or the newest (drop) or oldest (drop-oldest)
+    frame is discarded. A KGReloader swaps a newly trained KG in between two frames."""
+
+    def __init__(self, queue_size=4096, policy='block', state: DetectState = None, alerts: AlertSink = None,
+                 reloader: KGReloader = None):
+        if policy not in POLICIES:
+            raise ValueError('unknown queue policy: %s' % policy)
+        self.queue = asyncio.Queue(queue_size)
+        self.policy = policy
+        self.state = DetectState() if state is None else state
+        self.alerts = alerts
+        self.reloader = reloader
+        self.latency = LatencyStats()
+        self.received = 0
+        self.dropped = 0
+        self.attacks = 0
+        self.errors = 0  # frames decode_message()/match_feature() raised on
+
+    async def put(self, item):
+        self.received += 1
+        if self.policy == 'block':
+            await self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.policy == 'drop-oldest':
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.queue.put_nowait(item)
+
+    async def feed(self, reader: asyncio.StreamReader):
+        """Queue every candump line of the stream until EOF"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            arrival = time.perf_counter()
+            rec = parse_record(line)
+            if rec is not None:
+                await self.put((rec, arrival))
+
+    async def consume(self):
+        handled = 0
+        reloader = self.reloader
+        while True:
+            rec, arrival = await self.queue.get()
+            try:
+                if reloader is not None:
+                    reloader.poll(self.state)
+                msg = Msg.from_record(rec)
+                msg.signals = detect.decode_message(msg)
+                res = detect.match_feature(msg, self.state)
+                self.latency.add(time.perf_counter() - arrival)
+                if res != NORMAL:
+                    self.attacks += 1
+                    if self.alerts is not None:
+                        signal = self.state.signal if res == ERROR_SIGNAL_INFO or res == ERROR_SIGNAL_RELATION else None
+                        self.alerts.emit(msg.timestamp, msg.id, res, signal)
+            except Exception as e:  # a malformed frame must not stop the consumer
+                self.errors += 1
+                print('frame %x at %f skipped: %s: %s' % (rec.id, rec.timestamp, type(e).__name__, e), file=sys.stderr)
+            finally:
+                self.queue.task_done()
+            handled += 1
+            if handled % YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
+    def report(self):
+        print('received %d, processed %d, dropped %d, attacks %d, errors %d' % (
+            self.received, self.latency.count, self.dropped, self.attacks, self.errors))
+        print(self.latency)
+        if self.reloader is not None:
+            print(self.reloader)
+        if self.alerts is not None:
+            print(self.alerts)
+
+
+async def serve_stdin(live: LiveDetector):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    await live.feed(reader)
+
+
+async def serve_socket(live: LiveDetector, unix_path=None, host='127.0.0.1', port=0):
+    """Accept producers on a Unix socket or a TCP port until cancelled"""
+    async def handle(reader, writer):
+        try:
+            await live.feed(reader)
+        finally:
+            writer.close()
+
+    if unix_path:
+        server = await asyncio.start_unix_server(handle, unix_path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def _unless_stopped(consumer: asyncio.Task, aw):
+    """Await aw, raising the error of the consumer task instead if it ends first"""
+    task = asyncio.ensure_future(aw)
+    await asyncio.wait((task, consumer), return_when=asyncio.FIRST_COMPLETED)
+    if not task.done():
+        task.cancel()
+        consumer.result()
+        raise RuntimeError('frame consumer stopped')
+    return task.result()
+
+
+async def run(live: LiveDetector, unix_path=None, tcp=None):
+    consumer = asyncio.create_task(live.consume())
+    try:
+        if unix_path or tcp:
+            host, port = tcp.rsplit(':', 1) if tcp else (None, 0)
+            await _unless_stopped(consumer, serve_socket(live, unix_path, host, int(port)))
+        else:
+            await _unless_stopped(consumer, serve_stdin(live))
+            await _unless_stopped(consumer, live.queue.join())
+    finally:
+        consumer.cancel()
+        live.report()
+
+
+async def replay(fileName, unix_path=None, tcp=None, rate=None):
+    """Local producer: send a candump log to a running live detector, optionally at `rate` frames/s"""
+    if unix_path:
+        _, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        host, port = tcp.rsplit(':', 1)
+        _, writer = await asyncio.open_connection(host, int(port))
+    start = time.perf_counter()
+    with open(fileName, 'rb') as f:
+        for i, line in enumerate(f):
+            writer.write(line)
+            await writer.drain()
+            if rate:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+    writer.close()
+    await writer.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detect candump frames from stdin or a local socket')
+    parser.add_argument('--kg', default=r'../../data/KG/KG-ID_avg_period.ttl')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--unix', metavar='PATH')
+    source.add_argument('--tcp', metavar='HOST:PORT')
+    parser.add_argument('--queue', type=int, default=4096)
+    parser.add_argument('--policy', choices=POLICIES, default='block')
+    parser.add_argument('--replay', metavar='FILE', help='send FILE to the --unix/--tcp detector instead')
+    parser.add_argument('--rate', type=float, help='frames per second sent by --replay')
+    parser.add_argument('--alerts', metavar='FILE', help='.jsonl, .csv or .bin alert file')
+    parser.add_argument('--reload', type=float, metavar='SECONDS',
+                        help='check the KG every SECONDS and swap a changed one in without restarting')
+    args = parser.parse_args()
+
+    if args.replay:
+        asyncio.run(replay(args.replay, args.unix, args.tcp, args.rate))
+    else:
+        detect.load_graph(args.kg)
+        alerts = AlertSink(args.alerts) if args.alerts else None
+        reloader = KGReloader(args.kg, args.reload).start() if args.reload else None
+        try:
+            asyncio.run(run(LiveDetector(args.queue, args.policy, alerts=alerts, reloader=reloader),
+                            args.unix, args.tcp))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if reloader is not None:
+                reloader.stop()
+            if alerts is not None:
+                alerts.close()
@@ -0,0 +1,75 @@
+import sys
+from time import perf_counter_ns
+
+# relations are checked in the same pass over the signals as their value range and change rate: that time
+# is charged to signal, relation counts the messages of frames with relations and the ones they reject
+STAGES = ('read', 'decode', 'lookup', 'dlc', 'bit_pattern', 'signal', 'relation', 'interval')
+READ, DECODE, LOOKUP, DLC, BIT_PATTERN, SIGNAL, RELATION, INTERVAL = range(len(STAGES))
+
+
+class DetectProfiler:
+    """Call counts, cumulative time and rejections of every detection stage, per CAN ID.
+
+    Only the instrumented detection path touches it, the plain one pays nothing."""
+
+    def __init__(self):
+        self.ids: dict[int, list[int]] = {}  # id: [calls, ns, rejects] for every stage, flattened
+
+    def add(self, f_id, stage, ns, rejected=False):
+        stats = self.ids.get(f_id)
+        if stats is None:
+            stats = self.ids[f_id] = [0] * (3 * len(STAGES))
+        k = 3 * stage
+        stats[k] += 1
+        stats[k + 1] += ns
+        if rejected:
+            stats[k + 2] += 1
+
+    def timed_reader(self, msgs):
+        """Yield the messages of a reader, charging the time of every next() to the message read"""
+        msgs = iter(msgs)
+        while True:
+            start = perf_counter_ns()
+            msg = next(msgs, None)
+            if msg is None:
+                return
+            self.add(msg.id, READ, perf_counter_ns() - start)
+            yield msg
+
+    def timed_decode(self, decode):
+        """Wrap decode(msg) so every call is charged to the message's ID"""
+        def timed(msg):
+            start = perf_counter_ns()
+            info = decode(msg)
+            self.add(msg.id, DECODE, perf_counter_ns() - start)
+            return info
+        return timed
+
+    def totals(self):
+        totals = [0] * (3 * len(STAGES))
+        for stats in self.ids.values():
+            for k, v in enumerate(stats):
+                totals[k] += v
+        return totals
+
+    def clear(self):
+        self.ids.clear()
+
+    def report(self, top=10, file=None):
+        """Print the per stage totals and the IDs that cost the most time"""
+        file = file or sys.stdout
+        totals = self.totals()
+        all_ns = sum(totals[1::3]) or 1
+        print('%-12s %10s %10s %7s %9s %10s' % ('stage', 'calls', 'ms', 'share', 'ns/call', 'rejected'), file=file)
+        for stage, name in enumerate(STAGES):
+            calls, ns, rejects = totals[3 * stage:3 * stage + 3]
+            print('%-12s %10d %10.1f %6.1f%% %9.0f %10d' % (
+                name, calls, ns / 1e6, 100 * ns / all_ns, ns / calls if calls else 0, rejects), file=file)
+        ranked = sorted(self.ids.items(), key=lambda item: sum(item[1][1::3]), reverse=True)[:top]
+        print('%-8s %10s %10s  %s' % ('id', 'messages', 'ms', 'slowest stage / rejections'), file=file)
+        for f_id, stats in ranked:
+            ns = stats[1::3]
+            slowest = max(range(len(STAGES)), key=ns.__getitem__)
+            rejected = ', '.join('%s %d' % (STAGES[s], stats[3 * s + 2]) for s in range(len(STAGES)) if stats[3 * s + 2])
+            print('%-8s %10d %10.1f  %s / %s' % (hex(f_id), max(stats[0::3]), sum(ns) / 1e6,
+                                                 STAGES[slowest], rejected or '-'), file=file)
@@ -1,57 +1,97 @@
-class Relation:
-    def __init__(self, tarID, tarSig, cor):
-        self.targetID = tarID
-        self.targetSignal = tarSig
-        self.type = cor
-
-
-class Signal:
-    def __init__(self, maxVal, minVal, rate):
-        self.maxVal = maxVal
-        self.minVal = minVal
-        self.rate = rate
-        self.rel: list[Relation] = []
-
-
-class bitPattern:
-    def __init__(self, bits, val):
-        self.bits = bits
-        self.val = val
-
-
-class FrameInfo:
-    def __init__(self, frame_id: int):
-        self.id = frame_id
-        self.dlc = 0
-        self.isCycle = False
-        self.period = 0
-        self.jitter_min = 0
-        self.jitter_max = 0
-        self.signals: dict[str, Signal] = {}
-        self.bit_pattern: dict[int, bitPattern] = {}
-
-
-class Msg:
-    def __init__(self, infos: list, flag):
-        self.id = infos[0]
-        self.dlc = infos[1]
-        self.data = infos[2]
-        self.timestamp = infos[3]
-        self.signals: dict[str, float] = {}
-        self.flag = flag
-
-
-NORMAL = 0
-ERROR = 1
-ERROR_NOT_FOUND_ID = 2
-ERROR_DLC = 3
-ERROR_BIT_PATTERN = 4
-ERROR_SIGNAL_INFO = 5
-ERROR_SIGNAL_RELATION = 6
-ERROR_INTERVAL = 7
-
-
-FUZZY_ATTACK = 1
-FABRICATION_ATTACK = 2
-MASQUERADE_ATTACK = 3
-
+class Relation:
+    __slots__ = ('targetID', 'targetSignal', 'type')
+
+    def __init__(self, tarID, tarSig, cor):
+        self.targetID = tarID
+        self.targetSignal = tarSig
+        self.type = cor
+
+
+class Signal:
+    __slots__ = ('maxVal', 'minVal', 'rate', 'rel')
+
+    def __init__(self, maxVal, minVal, rate):
+        self.maxVal = maxVal
+        self.minVal = minVal
+        self.rate = rate
+        self.rel: list[Relation] = []
+
+
+class bitPattern:
+    __slots__ = ('bits', 'val')
+
+    def __init__(self, bits, val):
+        self.bits = bits
+        self.val = val
+
+
+class FrameInfo:
+    __slots__ = ('id', 'dlc', 'isCycle', 'period', 'jitter_min', 'jitter_max', 'signals', 'bit_pattern')
+
+    def __init__(self, frame_id: int):
+        self.id = frame_id
+        self.dlc = 0
+        self.isCycle = False
+        self.period = 0
+        self.jitter_min = 0
+        self.jitter_max = 0
+        self.signals: dict[str, Signal] = {}
+        self.bit_pattern: dict[int, bitPattern] = {}
+
+
+class DetectState:
+    """Detection state of one capture, carried from message to message by match_feature()"""
+
+    def __init__(self):
+        self.last_appear_time: dict[int, float] = {}
+        self.last_value: list = []  # first signal of the last message, by frame slot; None before the first one
+        self.signal_relation: list = []  # expected direction by signal id, None when no relation is pending
+        self.epoch = 0  # SignalIndex.epoch the lists have room for
+        self.signal = None  # offending signal of the last ERROR_SIGNAL_INFO/ERROR_SIGNAL_RELATION
+
+    def fit(self, index):
+        """Grow the lists to every id of a frame_rule.SignalIndex"""
+        epoch = index.epoch
+        self.last_value.extend([None] * (len(index.frames) - len(self.last_value)))
+        self.signal_relation.extend([None] * (len(index.signals) - len(self.signal_relation)))
+        self.epoch = epoch
+
+
+class Msg:
+    __slots__ = ('id', 'dlc', 'data', 'timestamp', 'signals', 'flag')
+
+    def __init__(self, infos: list, flag):
+        self.id = infos[0]
+        self.dlc = infos[1]
+        self.data = infos[2]
+        self.timestamp = infos[3]
+        self.signals: dict[str, float] = {}
+        self.flag = flag
+
+    @classmethod
+    def from_record(cls, rec):
+        """Msg of a candump.CanRecord, without the intermediate list"""
+        msg = cls.__new__(cls)
+        msg.id = rec.id
+        msg.dlc = rec.dlc
+        msg.data = rec.data
+        msg.timestamp = rec.timestamp
+        msg.signals = {}
+        msg.flag = rec.normal
+        return msg
+
+
+NORMAL = 0
+ERROR = 1
+ERROR_NOT_FOUND_ID = 2
+ERROR_DLC = 3
+ERROR_BIT_PATTERN = 4
+ERROR_SIGNAL_INFO = 5
+ERROR_SIGNAL_RELATION = 6
+ERROR_INTERVAL = 7
+
+
+FUZZY_ATTACK = 1
+FABRICATION_ATTACK = 2
+MASQUERADE_ATTACK = 3
+
@@ -1,318 +1,594 @@
-import copy
-from typing import Union
-import numpy as np
-from bitarray import bitarray
-
-
-class Signal:
-    def __init__(self, name, start, length):
-        self.name = name
-        self.start = start
-        self.length = length
-
-
-class CANMsg:
-    def __init__(self, content, flag=True):
-        self._id: int = content[0]
-        self._len: int = int(content[1])
-        self._data: bytes = copy.deepcopy(content[2])
-        self._timestamp: float = content[3]
-        self._normal: bool = flag
-
-    @property
-    def ID(self) -> int:
-        return self._id
-
-    @property
-    def data(self) -> bytes:
-        return self._data
-
-    @property
-    def time(self) -> float:
-        return self._timestamp
-
-    @property
-    def len(self) -> int:
-        return self._len
-
-    @property
-    def normal(self) -> bool:
-        return self._normal
-
-    def __format__(self, format_spec):
-        string = 'ID: ' + str(hex(self._id)) + '\n'
-        string += 'Len: ' + str(self._len) + '\n'
-        string += 'Data: ' + self._data.hex() + '\n'
-        string += 'Timestamp: ' + str(self._timestamp) + '\n'
-
-        return string
-
-
-class FrameInfo:
-    _MAX_POSSIBLE_VALUE_NUMBER = 10
-    _MAX_VARIANCE = 0.01
-
-    def __init__(self, frame_id: int, des: str):
-        self._id: int = frame_id  # frame id
-        self._description: str = des  # frame description
-        self._dlc: int = 0  # data length
-        self._value_range: dict[Union[str, int], list[Union[float, int]]] = {}  # signal value range:{signal:[min, max]}
-        self._change_rate: dict[Union[str, int], Union[int, float]] = {}  # signal value change rate: {signal: rate}
-        self._state_change: dict[str, list[list[str]]] = {}  # signal state change: {signal: [state]}, str type signal
-        self._interval: float = 0  # time interval
-        self._jitter: list[float] = [0, 0]  # time jitter: [min, max]
-        self._constant: bool = False  # weather value change
-        self._cycle: bool = True  # cycle frame
-        self._relation: set[Relation] = set()  # relationship to other frame
-
-        self._fix_bits: dict[int, [bitarray, int]] = {}
-        self._last_data: dict[int, bitarray] = {}
-        self._apper_time: list[float] = []  # last coming time
-        self._status: dict[str, list] = {}  # last status
-
-    def add_relation(self, rel):
-        self._relation.add(rel)
-
-    def set_dlc(self, new):
-        self._dlc = new
-
-    def set_fix_bits(self, byte, bit, value):
-        try:
-            self._fix_bits[byte][0] = bit
-            self._fix_bits[byte][1] = value
-        except KeyError:
-            return
-
-    def del_fix_bits(self, byte):
-        self._fix_bits.pop(byte)
-
-    def set_signal_range(self, signal, ran):
-        self._value_range[signal] = ran
-
-    def set_signal_rate(self, signal, rate):
-        self._change_rate[signal] = rate
-
-    def set_jitter(self, jitter):
-        self._jitter = jitter
-
-    def set_interval(self, interval):
-        self._interval = interval
-
-    @property
-    def ID(self) -> int:
-        return self._id
-
-    @property
-    def name(self) -> str:
-        return self._description
-
-    @property
-    def isConstant(self) -> bool:
-        return self._constant
-
-    @property
-    def status(self) -> dict:
-        return self._status
-
-    @property
-    def time_series(self) -> list:
-        return self._apper_time
-
-    @property
-    def dlc(self) -> int:
-        return self._dlc
-
-    @property
-    def value_range(self) -> dict:
-        return self._value_range
-
-    @property
-    def change_rate(self) -> dict:
-        return self._change_rate
-
-    @property
-    def state_change(self) -> dict:
-        return self._state_change
-
-    @property
-    def interval(self) -> float:
-        return self._interval
-
-    @property
-    def jitter(self) -> list:
-        return self._jitter
-
-    @property
-    def relation(self) -> set:
-        return self._relation
-
-    @property
-    def isCycle(self) -> bool:
-        return self._cycle
-
-    @property
-    def fix_bits(self) -> dict:
-        return self._fix_bits
-
-    def rel_clear(self):
-        self._relation.clear()
-
-    def cal_fix_value(self, data):
-        if self._last_data:  # examine fixed values
-            for key, item in self._last_data.items():
-                tmp = bitarray("{:0>8}".format(bin(data[key])[2:]))
-                bits = ~(tmp ^ item)
-                if key in self._fix_bits.keys():
-                    self._fix_bits[key][0] &= bits
-                else:
-                    self._fix_bits[key] = [bits, 0]
-                self._last_data[key] = tmp
-        else:  # initial fixed value
-            for i, num in enumerate(data):
-                self._last_data[i] = bitarray("{:0>8}".format(bin(num)[2:]))
-
-    def handle_new_message(self, msg: CANMsg, info: dict[str, Union[float, str]]):
-        """When a new message come, record its length, examine value property"""
-        data = msg.data
-        self._dlc = msg.len
-        self.cal_fix_value(data)
-
-        if self._status:
-            for key in info.keys():
-                self._status[key].append(info[key])
-        else:
-            for key in info.keys():
-                self._status[key] = [info[key]]
-
-        self._apper_time.append(msg.time)
-
-    def _calculate_attribute(self):
-        for key, item in list(self._fix_bits.items()):
-            tmp = self._last_data[key] & item[0]
-            self._fix_bits[key][1] = int.from_bytes(tmp, byteorder='big', signed=False)
-        for key, val in self._status.items():
-            len_val = len(val)
-            if type(val[0]) == int or type(val[0]) == float:  # signal value is a number
-                max_val = round(max(val), 4)
-                min_val = round(min(val), 4)
-                self._value_range[key] = [min_val, max_val]
-                rate = 0.0
-                for i in range(1, len_val):
-                    if val[i - 1] == max_val:
-                        continue
-                    tmp = abs(val[i] - val[i - 1])
-                    if tmp > rate:
-                        rate = tmp
-                self._change_rate[key] = round(rate, 4)
-            else:
-                self._state_change[key] = [[val[0]]]
-                for i in range(1, len_val):
-                    last = val[i - 1]
-                    now = val[i]
-                    if last == now:
-                        continue
-                    flag = True
-                    item = self._state_change[key]
-                    for sta in item:
-                        if sta[-1] == last:
-                            sta.append(now)
-                            flag = False
-                    if flag:
-                        item.append([last, now])
-
-    def _three_sigma(self, dataset, n=3):
-        mean = np.mean(dataset)
-        sigma = np.std(dataset)
-        new_dataset = []
-        for data in dataset:
-            if abs(data - mean) > n * sigma:
-                continue
-            new_dataset.append(data)
-        return new_dataset
-
-    def _calculate_interval(self):
-        """Handle message interval"""
-        interval: list = []
-        for i in range(0, len(self._apper_time) - 1):
-            inv = self._apper_time[i + 1] - self._apper_time[i]
-            interval.append(inv)
-        if len(interval) == 0:  # only apper once
-            pass
-        else:
-            interval = self._three_sigma(interval, 5)
-            var = np.var(interval, ddof=1)
-            if var < self._MAX_VARIANCE:  # 具有周期性
-                self._interval = round(np.mean(interval), 6)
-                self._jitter[0] = round(min(interval), 6) - self._interval
-                self._jitter[1] = round(max(interval), 6) - self._interval
-            else:
-                self._cycle = False
-
-    def handle_info(self):
-        self._calculate_attribute()
-        self._calculate_interval()
-
-    def __str__(self):
-        des = ""
-        des += "id: %d\n" % self._id
-        des += "Description: %s\n" % self._description
-        des += "DLC: " + self._dlc.__str__() + '\n'
-        des += "Constant: " + self._constant.__str__() + '\n'
-        des += "Value range: " + self._value_range.__str__() + '\n'
-        des += "Change rate: " + self._change_rate.__str__() + '\n'
-        des += "State Change: " + self._state_change.__str__() + '\n'
-        for rel in self._relation:
-            des += "Relation: " + rel.__str__() + '\n'
-        if self._cycle:
-            des += "Interval: %f" % self._interval + '\n'
-            des += "Jitter: " + self._jitter.__str__() + '\n\n'
-        return des
-
-
-class Relation:
-    def __init__(self, source_att: str, end_id: int, end_att: str, sup: float):
-        self._source_att = source_att
-        self._end_id = end_id
-        self._end_att = end_att
-        self._sup = sup
-
-    @property
-    def sourceAtt(self) -> str:
-        return self._source_att
-
-    @property
-    def endID(self) -> int:
-        return self._end_id
-
-    @property
-    def endAtt(self) -> str:
-        return self._end_att
-
-    @property
-    def sup(self):
-        return self._sup
-
-    @property
-    def relationType(self) -> bool:
-        return True if self._sup > 0 else False
-
-    def getInfo(self) -> list:
-        return [self._source_att, self._end_id, self._end_att]
-
-    def __str__(self):
-        s = "from att: " + self._source_att
-        s += " to " + str(self._end_id) + ':' + self._end_att
-        return s
-
-    def __hash__(self):
-        return hash(self._source_att + str(self._end_id) + str(self._end_att))
-
-    def __eq__(self, other):
-        att, e_id, e_att = other.getInfo()
-        if self._source_att == att and self._end_id == e_id and self._end_att == e_att:
-            return True
-        else:
-            return False
-
-    def __lt__(self, other):
-        return self._sup < other.sup
+import heapq
+import math
+from typing import Union
+import numpy as np
+
+
+class Signal:
+    __slots__ = ('name', 'start', 'length')
+
+    def __init__(self, name, start, length):
+        self.name = name
+        self.start = start
+        self.length = length
+
+
+class CANMsg:
+    __slots__ = ('_id', '_len', '_data', '_timestamp', '_normal')
+
+    def __init__(self, content, flag=True):
+        self._id: int = content[0]
+        self._len: int = int(content[1])
+        self._data: bytes = bytes(content[2])
+        self._timestamp: float = content[3]
+        self._normal: bool = flag
+
+    @classmethod
+    def from_record(cls, rec):
+        """CANMsg of a candump.CanRecord, without the intermediate list"""
+        msg = cls.__new__(cls)
+        msg._id = rec.id
+        msg._len = rec.dlc
+        msg._data = rec.data
+        msg._timestamp = rec.timestamp
+        msg._normal = rec.normal
+        return msg
+
+    @property
+    def ID(self) -> int:
+        return self._id
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+    @property
+    def time(self) -> float:
+        return self._timestamp
+
+    @property
+    def len(self) -> int:
+        return self._len
+
+    @property
+    def normal(self) -> bool:
+        return self._normal
+
+    def __format__(self, format_spec):
+        string = 'ID: ' + str(hex(self._id)) + '\n'
+        string += 'Len: ' + str(self._len) + '\n'
+        string += 'Data: ' + self._data.hex() + '\n'
+        string += 'Timestamp: ' + str(self._timestamp) + '\n'
+
+        return string
+
+
+class OnlineSignal:
+    """Constant memory counterpart of a signal's value list in FrameInfo._status.
+
+    Numbers keep their running min/max and the largest step change, split into
+    steps leaving the running maximum and all others, since _calculate_attribute()
+    ignores steps that leave the final maximum. Other values keep their state chains."""
+
+    def __init__(self, value):
+        self.numeric = type(value) == int or type(value) == float
+        self.min = self.max = self.last = value
+        self.rate = 0.0  # largest step from a value below the running maximum
+        self.rate_at_max = 0.0  # largest step from the running maximum
+        self.states = None if self.numeric else [[value]]
+
+    def add(self, value):
+        last = self.last
+        self.last = value
+        if not self.numeric:
+            if last == value:
+                return
+            flag = True
+            for sta in self.states:
+                if sta[-1] == last:
+                    sta.append(value)
+                    flag = False
+            if flag:
+                self.states.append([last, value])
+            return
+        step = abs(value - last)
+        if last == self.max:
+            if step > self.rate_at_max:
+                self.rate_at_max = step
+        elif step > self.rate:
+            self.rate = step
+        if value > self.max:
+            if self.rate_at_max > self.rate:
+                self.rate = self.rate_at_max
+            self.rate_at_max = 0.0
+            self.max = value
+        elif value < self.min:
+            self.min = value
+
+    def value_range(self):
+        return [round(self.min, 4), round(self.max, 4)]
+
+    def change_rate(self):
+        # the batch rule skips steps leaving round(max, 4), which is the maximum itself unless it has more decimals
+        rate = self.rate if self.max == round(self.max, 4) else max(self.rate, self.rate_at_max)
+        return round(rate, 4)
+
+
+class OnlineInterval:
+    """Welford mean/variance of the inter-arrival times plus their TAIL smallest and largest values.
+
+    filtered() applies the outlier rule of FrameInfo._three_sigma() by taking the
+    outliers back out of the running sums; it is exact while each side has fewer
+    than TAIL outliers, the results differ from the batch ones by float rounding only."""
+    TAIL = 64
+
+    def __init__(self):
+        self.last = None
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._low: list[float] = []  # max-heap of the negated smallest intervals
+        self._high: list[float] = []  # min-heap of the largest intervals
+
+    def add(self, time):
+        last = self.last
+        self.last = time
+        if last is None:
+            return
+        inv = time - last
+        self.n += 1
+        delta = inv - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (inv - self.mean)
+        if len(self._high) < self.TAIL:
+            heapq.heappush(self._high, inv)
+            heapq.heappush(self._low, -inv)
+        else:
+            heapq.heappushpop(self._high, inv)
+            heapq.heappushpop(self._low, -inv)
+
+    def filtered(self, n_sigma):
+        """Return (count, mean, sample variance, min, max) of the intervals within n_sigma std of the mean"""
+        n, mean, m2 = self.n, self.mean, self.m2
+        bound = n_sigma * math.sqrt(m2 / n)
+        low = sorted(-x for x in self._low)
+        high = sorted(self._high, reverse=True)
+        kept_min = kept_max = None
+        for values, outside in ((low, lambda x: self.mean - x > bound), (high, lambda x: x - self.mean > bound)):
+            kept = None
+            for x in values:
+                if not outside(x):
+                    kept = x
+                    break
+                if n > 1:  # reverse Welford update
+                    new_mean = (n * mean - x) / (n - 1)
+                    m2 -= (x - new_mean) * (x - mean)
+                    mean = new_mean
+                n -= 1
+            if values is low:
+                kept_min = kept if kept is not None else self.mean - bound
+            else:
+                kept_max = kept if kept is not None else self.mean + bound
+        var = m2 / (n - 1) if n > 1 else float('nan')
+        return n, mean, var, kept_min, kept_max
+
+
+class FrameInfo:
+    _MAX_POSSIBLE_VALUE_NUMBER = 10
+    _MAX_VARIANCE = 0.01
+    __slots__ = ('_id', '_description', '_dlc', '_value_range', '_change_rate', '_state_change', '_interval',
+                 '_interval_count', '_jitter', '_constant', '_cycle', '_relation', '_fix_bits', '_payloads',
+                 '_payload_len', '_last_word', '_fix_mask', '_apper_time', '_status', '_online', '_signal_stats',
+                 '_interval_stats')
+
+    def __init__(self, frame_id: int, des: str, online=False):
+        self._id: int = frame_id  # frame id
+        self._description: str = des  # frame description
+        self._dlc: int = 0  # data length
+        self._value_range: dict[Union[str, int], list[Union[float, int]]] = {}  # signal value range:{signal:[min, max]}
+        self._change_rate: dict[Union[str, int], Union[int, float]] = {}  # signal value change rate: {signal: rate}
+        self._state_change: dict[str, list[list[str]]] = {}  # signal state change: {signal: [state]}, str type signal
+        self._interval: float = 0  # time interval
+        self._interval_count: int = 0  # intervals the period was computed from
+        self._jitter: list[float] = [0, 0]  # time jitter: [min, max]
+        self._constant: bool = False  # weather value change
+        self._cycle: bool = True  # cycle frame
+        self._relation: set[Relation] = set()  # relationship to other frame
+
+        self._fix_bits: dict[int, list[int]] = {}  # {byte: [bits, value]}
+        self._payloads: int = 0  # number of payloads seen
+        self._payload_len: int = 0  # length of the first payload, its bytes are the fixed bit candidates
+        self._last_word: int = 0  # last payload as a big endian integer
+        self._fix_mask: int = 0  # bits equal in all consecutive payloads
+        self._apper_time: list[float] = []  # last coming time
+        self._status: dict[str, list] = {}  # last status
+
+        # online mode keeps running statistics instead of _apper_time and _status
+        self._online = online
+        self._signal_stats: dict[str, OnlineSignal] = {}
+        self._interval_stats = OnlineInterval()
+
+    def add_relation(self, rel):
+        self._relation.add(rel)
+
+    def set_dlc(self, new):
+        self._dlc = new
+
+    def set_fix_bits(self, byte, bit, value):
+        try:
+            self._fix_bits[byte][0] = bit
+            self._fix_bits[byte][1] = value
+        except KeyError:
+            return
+
+    def del_fix_bits(self, byte):
+        self._fix_bits.pop(byte)
+
+    def set_signal_range(self, signal, ran):
+        self._value_range[signal] = ran
+
+    def set_signal_rate(self, signal, rate):
+        self._change_rate[signal] = rate
+
+    def set_jitter(self, jitter):
+        self._jitter = jitter
+
+    def set_interval(self, interval):
+        self._interval = interval
+
+    @property
+    def ID(self) -> int:
+        return self._id
+
+    @property
+    def name(self) -> str:
+        return self._description
+
+    @property
+    def messages(self) -> int:
+        return self._payloads
+
+    @property
+    def isConstant(self) -> bool:
+        return self._constant
+
+    @property
+    def status(self) -> dict:
+        return self._status
+
+    @property
+    def time_series(self) -> list:
+        return self._apper_time
+
+    @property
+    def dlc(self) -> int:
+        return self._dlc
+
+    @property
+    def value_range(self) -> dict:
+        return self._value_range
+
+    @property
+    def change_rate(self) -> dict:
+        return self._change_rate
+
+    @property
+    def state_change(self) -> dict:
+        return self._state_change
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def jitter(self) -> list:
+        return self._jitter
+
+    @property
+    def relation(self) -> set:
+        return self._relation
+
+    @property
+    def isCycle(self) -> bool:
+        return self._cycle
+
+    @property
+    def fix_bits(self) -> dict:
+        return self._fix_bits
+
+    def rel_clear(self):
+        self._relation.clear()
+
+    def cal_fix_value(self, data):
+        """AND-reduce the XNOR of consecutive payloads, all bytes at once as one integer"""
+        n = self._payload_len
+        if self._payloads == 0:  # initial fixed value
+            n = self._payload_len = len(data)
+            self._fix_mask = (1 << 8 * n) - 1
+            self._last_word = int.from_bytes(data, byteorder='big')
+        else:  # examine fixed values
+            if len(data) != n:
+                if len(data) < n:  # bytes absent from a payload are not fixed
+                    self._fix_mask &= ~((1 << 8 * (n - len(data))) - 1)
+                data = data[:n].ljust(n, b'\0')
+            word = int.from_bytes(data, byteorder='big')
+            self._fix_mask &= ~(word ^ self._last_word)
+            self._last_word = word
+        self._payloads += 1
+
+    def handle_new_message(self, msg: CANMsg, info: dict[str, Union[float, str]]):
+        """When a new message come, record its length, examine value property"""
+        data = msg.data
+        self._dlc = msg.len
+        self.cal_fix_value(data)
+
+        if self._online:
+            stats = self._signal_stats
+            if stats:
+                for key in info.keys():
+                    stats[key].add(info[key])
+            else:
+                for key in info.keys():
+                    stats[key] = OnlineSignal(info[key])
+            self._interval_stats.add(msg.time)
+            return
+
+        if self._status:
+            for key in info.keys():
+                self._status[key].append(info[key])
+        else:
+            for key in info.keys():
+                self._status[key] = [info[key]]
+
+        self._apper_time.append(msg.time)
+
+    def _calculate_attribute(self):
+        if self._payloads > 1:
+            n = self._payload_len
+            for key in range(n):
+                shift = 8 * (n - 1 - key)
+                bits = (self._fix_mask >> shift) & 0xFF
+                self._fix_bits[key] = [bits, (self._last_word >> shift) & bits]
+        for key, stats in self._signal_stats.items():
+            if stats.numeric:
+                self._value_range[key] = stats.value_range()
+                self._change_rate[key] = stats.change_rate()
+            else:
+                self._state_change[key] = stats.states
+        for key, val in self._status.items():
+            len_val = len(val)
+            if type(val[0]) == int or type(val[0]) == float:  # signal value is a number
+                max_val = round(max(val), 4)
+                min_val = round(min(val), 4)
+                self._value_range[key] = [min_val, max_val]
+                rate = 0.0
+                for i in range(1, len_val):
+                    if val[i - 1] == max_val:
+                        continue
+                    tmp = abs(val[i] - val[i - 1])
+                    if tmp > rate:
+                        rate = tmp
+                self._change_rate[key] = round(rate, 4)
+            else:
+                self._state_change[key] = [[val[0]]]
+                for i in range(1, len_val):
+                    last = val[i - 1]
+                    now = val[i]
+                    if last == now:
+                        continue
+                    flag = True
+                    item = self._state_change[key]
+                    for sta in item:
+                        if sta[-1] == last:
+                            sta.append(now)
+                            flag = False
+                    if flag:
+                        item.append([last, now])
+
+    def _three_sigma(self, dataset, n=3):
+        mean = np.mean(dataset)
+        sigma = np.std(dataset)
+        new_dataset = []
+        for data in dataset:
+            if abs(data - mean) > n * sigma:
+                continue
+            new_dataset.append(data)
+        return new_dataset
+
+    def _calculate_interval_online(self):
+        """_calculate_interval() over the running interval statistics"""
+        if self._interval_stats.n == 0:  # only apper once
+            return
+        n, mean, var, min_inv, max_inv = self._interval_stats.filtered(5)
+        self._interval_count = n
+        if var < self._MAX_VARIANCE:
+            self._interval = round(mean, 6)
+            self._jitter[0] = round(min_inv, 6) - self._interval
+            self._jitter[1] = round(max_inv, 6) - self._interval
+        else:
+            self._cycle = False
+
+    def _calculate_interval(self):
+        """Handle message interval"""
+        if self._online:
+            self._calculate_interval_online()
+            return
+        interval: list = []
+        for i in range(0, len(self._apper_time) - 1):
+            inv = self._apper_time[i + 1] - self._apper_time[i]
+            interval.append(inv)
+        if len(interval) == 0:  # only apper once
+            pass
+        else:
+            interval = self._three_sigma(interval, 5)
+            self._interval_count = len(interval)
+            var = np.var(interval, ddof=1)
+            if var < self._MAX_VARIANCE:  # 具有周期性
+                self._interval = round(np.mean(interval), 6)
+                self._jitter[0] = round(min(interval), 6) - self._interval
+                self._jitter[1] = round(max(interval), 6) - self._interval
+            else:
+                self._cycle = False
+
+    def handle_info(self):
+        self._calculate_attribute()
+        self._calculate_interval()
+
+    def clear_series(self):
+        """Drop what handle_info() was computed from, leaving only the summary"""
+        self._status = {}
+        self._apper_time = []
+        self._signal_stats = {}
+        self._interval_stats = OnlineInterval()
+
+    def merge(self, other):
+        """Fold the summary of the same frame in another capture into this one.
+
+        The merge is associative, summaries of many captures can be combined in any tree shape."""
+        self._dlc = other._dlc
+        for byte, (bit, val) in list(self._fix_bits.items()):
+            try:
+                new_bit, new_val = other._fix_bits[byte]
+            except KeyError:  # 这一 byte 位模式在另一数据文件中未出现
+                self._fix_bits.pop(byte)
+                continue
+            self._fix_bits[byte] = [~(val ^ new_val) & bit & new_bit, val & new_val]
+        for name, ran in other._value_range.items():
+            if name in self._value_range:
+                old = self._value_range[name]
+                self._value_range[name] = [min(old[0], ran[0]), max(old[1], ran[1])]
+                self._change_rate[name] = max(self._change_rate[name], other._change_rate[name])
+            else:
+                self._value_range[name] = list(ran)
+                self._change_rate[name] = other._change_rate[name]
+        for name, states in other._state_change.items():
+            self._state_change.setdefault(name, states)
+        self._relation |= other._relation
+
+        # a frame seen once has no interval and takes the other's timing
+        if self._interval_count == 0:
+            self._cycle, self._interval, self._jitter = other._cycle, other._interval, list(other._jitter)
+        elif other._interval_count and self._cycle and other._cycle:
+            count = self._interval_count + other._interval_count
+            interval = (self._interval * self._interval_count + other._interval * other._interval_count) / count
+            low = min(self._interval + self._jitter[0], other._interval + other._jitter[0])
+            high = max(self._interval + self._jitter[1], other._interval + other._jitter[1])
+            self._interval = interval
+            self._jitter = [low - interval, high - interval]
+        elif other._interval_count:
+            self._cycle = False
+        self._interval_count += other._interval_count
+        self._payloads += other._payloads
+        return self
+
+    def __str__(self):
+        des = ""
+        des += "id: %d\n" % self._id
+        des += "Description: %s\n" % self._description
+        des += "DLC: " + self._dlc.__str__() + '\n'
+        des += "Constant: " + self._constant.__str__() + '\n'
+        des += "Value range: " + self._value_range.__str__() + '\n'
+        des += "Change rate: " + self._change_rate.__str__() + '\n'
+        des += "State Change: " + self._state_change.__str__() + '\n'
+        for rel in self._relation:
+            des += "Relation: " + rel.__str__() + '\n'
+        if self._cycle:
+            des += "Interval: %f" % self._interval + '\n'
+            des += "Jitter: " + self._jitter.__str__() + '\n\n'
+        return des
+
+
+class FrameRegistry:
+    """FrameInfo of every ID seen, keyed by ID in insertion order.
+
+    new_frame(frame_id) creates the FrameInfo of an unseen ID, so its name is resolved once."""
+
+    def __init__(self, new_frame=None):
+        self._frames: dict[int, FrameInfo] = {}
+        self._new_frame = new_frame
+
+    def get(self, frame_id: int) -> FrameInfo:
+        try:
+            return self._frames[frame_id]
+        except KeyError:
+            frame = self._frames[frame_id] = self._new_frame(frame_id)
+            return frame
+
+    def add(self, frame: FrameInfo):
+        self._frames[frame.ID] = frame
+
+    def merge(self, other):
+        """FrameInfo.merge() the frames of another registry into this one, adding the unknown ones"""
+        for frame in other:
+            own = self._frames.get(frame.ID)
+            if own is None:
+                self._frames[frame.ID] = frame
+            else:
+                own.merge(frame)
+        return self
+
+    def clear(self):
+        self._frames.clear()
+
+    def __getitem__(self, frame_id: int) -> FrameInfo:
+        return self._frames[frame_id]
+
+    def __contains__(self, frame_id: int):
+        return frame_id in self._frames
+
+    def __iter__(self):
+        return iter(self._frames.values())
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class Relation:
+    __slots__ = ('_source_att', '_end_id', '_end_att', '_sup')
+
+    def __init__(self, source_att: str, end_id: int, end_att: str, sup: float):
+        self._source_att = source_att
+        self._end_id = end_id
+        self._end_att = end_att
+        self._sup = sup
+
+    @property
+    def sourceAtt(self) -> str:
+        return self._source_att
+
+    @property
+    def endID(self) -> int:
+        return self._end_id
+
+    @property
+    def endAtt(self) -> str:
+        return self._end_att
+
+    @property
+    def sup(self):
+        return self._sup
+
+    @property
+    def relationType(self) -> bool:
+        return True if self._sup > 0 else False
+
+    def getInfo(self) -> list:
+        return [self._source_att, self._end_id, self._end_att]
+
+    def __str__(self):
+        s = "from att: " + self._source_att
+        s += " to " + str(self._end_id) + ':' + self._end_att
+        return s
+
+    def __hash__(self):
+        return hash(self._source_att + str(self._end_id) + str(self._end_att))
+
+    def __eq__(self, other):
+        att, e_id, e_att = other.getInfo()
+        if self._source_att == att and self._end_id == e_id and self._end_att == e_att:
+            return True
+        else:
+            return False
+
+    def __lt__(self, other):
+        return self._sup < other.sup
@@ -1,288 +1,446 @@
-import csv
-import re
-import json
-
-from bitarray import bitarray
-
-from CANClass import CANMsg, FrameInfo, Relation
-from kg_management import KnowledgeGraph
-import cantools
-from scipy.stats import pearsonr
-
-
-Frames: list[FrameInfo] = []
-DBC_FILE = r'../../data/DBC/anonymized.dbc'
-DBC_INFO = cantools.db.load_file(DBC_FILE)
-KG_FILE = r'../data/KG/kg_0.9'
-MIN_SUPPORT = 0.9
-node_file = r'../../data/DBC/nodes.csv'
-
-
-def read_file_generator(trainFile):
-    with open(trainFile, 'r', encoding='utf-8') as file:
-        pattern = r'^\((.*?)\) can0 (.*?)#(.*?)$'
-        while True:
-            line = file.readline()
-            if line:
-                matchObj = re.match(pattern, line)
-                content = [0, 8, 0, 0]
-                if matchObj:
-                    tmp = list(matchObj.groups())
-                else:
-                    continue
-                content[0] = int(tmp[1], 16)  # id
-                content[2] = bytes.fromhex(tmp[2])  # data
-                content[3] = float(tmp[0])  # timestamp
-                msg = CANMsg(content)
-                yield msg
-            else:
-                return
-
-
-def find_frame(frame_id: int):
-    for frame in Frames:
-        if frame.ID == frame_id:
-            return frame
-    try:  # not found
-        name = DBC_INFO.get_message_by_frame_id(frame_id).name
-    except KeyError:
-        name = 'Common'
-    frame = FrameInfo(frame_id, name)
-    Frames.append(frame)
-    return frame
-
-
-def find_time_index(time_series: list, time: int, index: int):
-    time_window = 1000
-    for i in range(index, len(time_series)):
-        if time_series[i] > time:
-            if time_series[i] < time + time_window:
-                return i
-            else:
-                return -1
-    return -1
-
-
-def common_process(msg):
-    info = {}
-    data = msg.data
-    for i in range(0, msg.len):
-        info['Unknown_' + str(i)] = data[i]
-    return info
-
-
-def extract_node():
-    frames_info = {}
-    with open(node_file, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            frames_info[row[0]] = [row[1], row[2]]
-    return frames_info
-
-
-# extract information from message
-def extract_info(trainFile):
-    can_data = read_file_generator(trainFile)
-    total = 0
-    for msg in can_data:
-        frame_id = msg.ID
-        data = msg.data
-        frame = find_frame(frame_id)
-        try:
-            info = DBC_INFO.decode_message(frame_id, data)
-            if len(info) == 0:
-                info = common_process(msg)
-        except KeyError:
-            info = common_process(msg)
-        try:
-            frame.handle_new_message(msg, info)
-        except ValueError:
-            print("ValueError: %d" % frame_id)
-            print(info)
-        total += 1
-    print("total: " + str(total))
-    for frame in Frames:
-        frame.handle_info()
-
-
-def save_info():
-    try:
-        saveFile = open(r'../data/extractInfo.csv', 'w', encoding='utf-8')
-        for frame in Frames:
-            info = frame.__str__()
-            saveFile.write(info)
-        saveFile.close()
-    except IOError:
-        print("Can't open save file!")
-
-
-def extract_relation():
-    num_counts = 100
-    cal_ids = dict()
-    for fra in Frames:
-        if not fra.isConstant:
-            times = fra.time_series
-            if len(times) > num_counts:
-                cal_ids[fra.ID] = len(times)
-    cal_ids = sorted(cal_ids.items(), key=lambda x: x[1], reverse=True)
-    ids = [x[0] for x in cal_ids]
-    for i in range(0, len(ids)):
-        y = ids[i]
-        y_frame = find_frame(y)
-        y_status = dict()
-        for key, val in y_frame.status.items():
-            if type(val[0]) != int and type(val[0]) != float:
-                continue
-            y_status[str(y) + ':' + str(key)] = [round(x, 4) for x in val]
-        y_time = y_frame.time_series
-        y_str = str(y)
-        for j in range(i + 1, len(ids)):
-            x = ids[j]
-            x_frame = find_frame(x)
-            x_status = dict()
-            for key, val in x_frame.status.items():
-                if type(val[0]) != int and type(val[0]) != float:
-                    continue
-                x_status[str(x) + ':' + str(key)] = [round(x, 4) for x in val]
-            x_time = x_frame.time_series
-            y_index = 0
-            tmp = dict()
-            for x_index, time in enumerate(x_time):
-                y_index = find_time_index(y_time, time, y_index)
-                if y_index == -1:
-                    continue
-                for key, val in y_status.items():
-                    if key in tmp.keys():
-                        tmp[key].append(val[y_index])
-                    else:
-                        tmp[key] = [val[y_index]]
-                for key, val in x_status.items():
-                    if key in tmp.keys():
-                        tmp[key].append(val[x_index])
-                    else:
-                        tmp[key] = [val[x_index]]
-            if tmp:
-                for key in list(tmp.keys()):
-                    val = set(tmp[key])
-                    if len(val) == 1:
-                        del tmp[key]
-                if len(tmp) <= 1:
-                    continue
-                keys = list(tmp.keys())
-                for ind in range(0, len(keys) - 1):
-                    cor, p = pearsonr(tmp[keys[ind]], tmp[keys[ind + 1]])
-                    if 0 < cor < MIN_SUPPORT or -MIN_SUPPORT < cor < 0:
-                        continue
-                    source_id, source_att = keys[ind].split(':')
-                    end_id, end_att = keys[ind + 1].split(':')
-                    source_frame = find_frame(int(source_id))
-                    rel = Relation(source_att, int(end_id), end_att, cor)
-                    source_frame.add_relation(rel)
-
-
-def update_frame_info(origin: list[FrameInfo], new: list[FrameInfo]):
-
-    origin_dict, new_dict = {}, {}
-    for frame in origin:
-        origin_dict[frame.ID] = frame
-    for frame in new:
-        new_dict[frame.ID] = frame
-    for f_id, frame in origin_dict.items():
-        try:
-            f_new = new_dict[frame.ID]
-        except KeyError:
-            continue
-        if f_new.dlc != frame.dlc:
-            frame.set_dlc(f_new.dlc)
-
-        # update fix values
-        f_bits = frame.fix_bits
-        new_bits = f_new.fix_bits
-        for byte, v in f_bits.items():
-            bit, val = v
-            try:
-                new_bit, new_val = new_bits[byte]
-                if bit == new_bit and val == new_val:
-                    continue
-                else:
-                    val_bitarray = bitarray("{:0>8}".format(bin(val)[2:]))
-                    new_val_bitarray = bitarray("{:0>8}".format(bin(new_val)[2:]))
-                    tmp_bit = ~(val_bitarray ^ new_val_bitarray) & (bit & new_bit)
-                    tmp_val = val_bitarray & new_val_bitarray
-                    frame.set_fix_bits(byte, tmp_bit, int.from_bytes(tmp_val, byteorder='little', signed=False))
-            except KeyError:  # 这一 byte 位模式在另一数据文件中未出现
-                frame.del_fix_bits(byte)
-
-        # update signal
-        f_signal_range = frame.value_range
-        f_change_rate = frame.change_rate
-        n_ranges = f_new.value_range
-        n_rates = f_new.change_rate
-
-        for name, ran in f_signal_range.items():
-            n_ran = n_ranges[name]
-            n_rate = n_rates[name]
-            min_ran, max_ran = ran
-            if min_ran > n_ran[0]:
-                min_ran = n_ran[0]
-            if max_ran < n_ran[1]:
-                max_ran = n_ran[1]
-            frame.set_signal_range(name, [min_ran, max_ran])
-            if f_change_rate[name] < n_rate:
-                frame.set_signal_rate(name, n_rate)
-
-        f_relations = frame.relation
-        n_relations = f_new.relation
-        for rel in n_relations:
-            for r in f_relations:
-                if rel.sourceAtt != r.sourceAtt:
-                    continue
-                if rel.endAtt != r.endAtt or rel.endID != rel.endID:
-                    frame.add_relation(rel)
-                    break
-        if f_new.isCycle and frame.isCycle:
-            fn_min = f_new.jitter[0] + f_new.interval
-            f_min = frame.jitter[0] + frame.interval
-            fn_max = f_new.jitter[1] + f_new.interval
-            f_max = frame.jitter[1] + frame.interval
-            new_int = (f_new.interval + frame.interval) / 2
-            frame.set_interval(new_int)
-            new_max = f_max if f_max > fn_max else fn_max
-            new_min = f_min if f_min < fn_min else fn_min
-            frame.set_jitter([new_min - new_int, new_max - new_int])
-
-def main():
-    global KG_FILE, MIN_SUPPORT, Frames
-    arg = 6
-    KG_FILE = r'../../data/KG/KG-ID_avg_period.ttl'
-    MIN_SUPPORT += int(arg) / 100
-    MIN_SUPPORT = round(MIN_SUPPORT, 2)
-    graph = KnowledgeGraph()
-
-    print('MIN_SUPPORT: ' + str(MIN_SUPPORT))
-    print('KG_FILE: ' + str(KG_FILE))
-
-    frame_to_node = {}  # extract_node()
-
-    with open(r'../../data/ambient/capture_metadata.json') as f:
-        f_json = json.load(f)
-    frame_info = []
-    for key, item in f_json.items():
-        Frames = []
-        train_file = r'../../data/ambient/' + key + '.log'
-        print('*************START************')
-        print(train_file)
-        extract_info(train_file)
-        # extract_relation()
-        if len(frame_info) == 0:
-            frame_info = Frames
-        else:
-            update_frame_info(frame_info, Frames)
-        print('*************END************')
-
-    graph.add_new_info(frame_to_node, frame_info)
-    graph.save_graph_as_turtle(KG_FILE)
-
-
-if __name__ == '__main__':
-    main()
+import csv
+import json
+import os
+import sys
+from functools import partial
+
+
+from CANClass import CANMsg, FrameInfo, FrameRegistry, Relation
+from kg_management import KnowledgeGraph, signal_4095
+import triple_store
+import cantools
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from file_cache import file_digest
+from summary_cache import cached_summary, save_summary
+from process_pool import pool_context
+from trace_cache import cached_records
+from decode_cache import DecodeCache
+from signal_decoder import SignalDecoder
+
+
+DBC_FILE = r'../../data/DBC/anonymized.dbc'
+DBC_INFO = cantools.db.load_file(DBC_FILE)
+DECODE_CACHE = DecodeCache()
+SIGNAL_DECODER = SignalDecoder(DBC_INFO, lambda f_id: [s.name for s in signal_4095])
+KG_FILE = r'../data/KG/kg_0.9'
+MIN_SUPPORT = 0.9
+TIME_WINDOW = 1000  # largest gap of two aligned samples
+RELATION_BLOCKS = 16  # blocks of frame IDs handed to the relation workers
+RELATION_PAIR_BUDGET = 1000000  # signal pairs followed by RelationStream
+ONLINE_STATS = False  # constant memory FrameInfo statistics, extract_relation() needs the full series
+node_file = r'../../data/DBC/nodes.csv'
+SUMMARY_DIR = r'../../data/ambient/summaries'
+TRACE_DIR = None  # read the captures from their memory mapped traces there, see trace_cache.py
+KG_STORE = None  # e.g. r'../../data/KG/kg.sqlite', keep the KG in a SQLiteTriples store and only write what changes
+
+
+def read_file_generator(trainFile):
+    return map(CANMsg.from_record, cached_records(trainFile, TRACE_DIR))
+
+
+def new_frame(frame_id: int):
+    try:
+        name = DBC_INFO.get_message_by_frame_id(frame_id).name
+    except KeyError:
+        name = 'Common'
+    return FrameInfo(frame_id, name, ONLINE_STATS)
+
+
+Frames = FrameRegistry(new_frame)
+
+
+def find_frame(frame_id: int, frames: FrameRegistry = None):
+    return (Frames if frames is None else frames).get(frame_id)
+
+
+def align_index(time_series: np.ndarray, times: np.ndarray):
+    """Index of the first sample of time_series after every time, -1 if there is none within TIME_WINDOW"""
+    index = np.searchsorted(time_series, times, side='right')
+    found = index < len(time_series)
+    index[~found] = 0
+    found &= time_series[index] < times + TIME_WINDOW
+    index[~found] = -1
+    return index
+
+
+def extract_node():
+    frames_info = {}
+    with open(node_file, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        for row in reader:
+            frames_info[row[0]] = [row[1], row[2]]
+    return frames_info
+
+
+# extract information from message
+def decode_info(frame_id, data, dlc):
+    info = DECODE_CACHE.get(frame_id, data)
+    if info is None:
+        info = SIGNAL_DECODER.decode(frame_id, data, dlc)
+        if len(info) == 0:
+            info = SIGNAL_DECODER.decode_fallback(frame_id, data, dlc)
+        DECODE_CACHE.put(frame_id, data, info)
+    return info
+
+
+def extract_info(trainFile, frames: FrameRegistry = None):
+    frames = Frames if frames is None else frames
+    get_frame = frames.get
+    can_data = read_file_generator(trainFile)
+    total = 0
+    for msg in can_data:
+        frame_id = msg.ID
+        data = msg.data
+        frame = get_frame(frame_id)
+        info = decode_info(frame_id, data, msg.len)
+        try:
+            frame.handle_new_message(msg, info)
+        except ValueError:
+            print("ValueError: %d" % frame_id)
+            print(info)
+        total += 1
+    print("total: " + str(total))
+    print(DECODE_CACHE)
+    for frame in frames:
+        frame.handle_info()
+
+
+def save_info(frames: FrameRegistry = None):
+    try:
+        saveFile = open(r'../data/extractInfo.csv', 'w', encoding='utf-8')
+        for frame in Frames if frames is None else frames:
+            info = frame.__str__()
+            saveFile.write(info)
+        saveFile.close()
+    except IOError:
+        print("Can't open save file!")
+
+
+def _numeric_series(frame: FrameInfo):
+    """(id, signal names, timestamps, values as a samples x signals matrix) of the numeric signals of a frame"""
+    names = [key for key, val in frame.status.items() if type(val[0]) == int or type(val[0]) == float]
+    times = np.asarray(frame.time_series, dtype=float)
+    values = np.empty((len(times), len(names)))
+    for k, key in enumerate(names):
+        values[:, k] = frame.status[key]
+    return frame.ID, names, times, np.round(values, 4)
+
+
+def _correlation(a: np.ndarray, b: np.ndarray):
+    """Pearson coefficients of every column of a with every column of b, nan for constant columns"""
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    norm = np.outer(np.sqrt((a * a).sum(axis=0)), np.sqrt((b * b).sum(axis=0)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.clip((a.T @ b) / norm, -1, 1)
+
+
+def _pair_relations(y, x):
+    """Relations between the signals of two frames, the samples of y joined to the timestamps of x.
+
+    x is None for the relations inside frame y."""
+    y_id, y_names, y_time, y_values = y
+    if x is None:
+        x_id, x_names, x_values = y_id, y_names, y_values
+    else:
+        x_id, x_names, x_time, x_values = x
+        index = align_index(y_time, x_time)
+        found = index >= 0
+        x_values, y_values = x_values[found], y_values[index[found]]
+    if len(x_values) < 2:
+        return []
+    cor = _correlation(y_values, x_values)
+    if x is None:
+        cor = np.triu(cor, 1)
+    rows, cols = np.nonzero(np.abs(cor) >= MIN_SUPPORT)
+    return [(y_id, y_names[r], x_id, x_names[c], float(cor[r, c])) for r, c in zip(rows, cols)]
+
+
+_RELATION_SERIES: list = []  # _numeric_series() of the frames mined by extract_relation()
+
+
+def _init_relation_worker(series):
+    global _RELATION_SERIES
+    _RELATION_SERIES = series
+
+
+def _relation_block(block):
+    """Relations of the frames in block with themselves and with every frame after them"""
+    series = _RELATION_SERIES
+    found = []
+    for i in block:
+        found += _pair_relations(series[i], None)
+        for j in range(i + 1, len(series)):
+            found += _pair_relations(series[i], series[j])
+    return found
+
+
+def extract_relation(workers=1, frames: FrameRegistry = None):
+    """Correlate every pair of numeric signals, the frames aligned on the timestamps of the less frequent one.
+
+    Frames are handed out to `workers` processes in RELATION_BLOCKS interleaved blocks."""
+    if ONLINE_STATS:
+        print('No signal series kept with ONLINE_STATS, use extract_relation_stream()')
+        return
+    num_counts = 100
+    frames = Frames if frames is None else frames
+    cal_frames = [fra for fra in frames if not fra.isConstant and len(fra.time_series) > num_counts]
+    cal_frames.sort(key=lambda fra: len(fra.time_series), reverse=True)
+    series = [_numeric_series(fra) for fra in cal_frames]
+    blocks = [range(k, len(series), RELATION_BLOCKS) for k in range(min(RELATION_BLOCKS, len(series)))]
+    def add_relations(found):
+        for source_id, source_att, end_id, end_att, cor in found:
+            frames[source_id].add_relation(Relation(source_att, end_id, end_att, cor))
+
+    if workers == 1:
+        _init_relation_worker(series)
+        for block in blocks:
+            add_relations(_relation_block(block))
+        return
+    with pool_context().Pool(workers, initializer=_init_relation_worker, initargs=(series,)) as pool:
+        for found in pool.imap(_relation_block, blocks):
+            add_relations(found)
+
+
+class RelationStream:
+    """Co-moments of the signal pairs extract_relation() correlates, accumulated message by message.
+
+    Every frame adds its samples [1, v, v*v] to the running sums G. When a frame
+    arrives, the part of G its partner frames added since its last arrival holds the
+    partner samples waiting for it, the join align_index() makes, so their cross
+    products are this sample times that difference. Only sums are kept: memory is
+    O(signal pairs) whatever the capture length. Results differ from extract_relation()
+    only for samples with equal timestamps and for frames silent for more than
+    TIME_WINDOW, whose waiting partner samples are dropped."""
+
+    def __init__(self, frames: FrameRegistry, max_pairs=RELATION_PAIR_BUDGET):
+        num_counts = 100
+        frames = [fra for fra in frames if not fra.isConstant and fra.messages > num_counts]
+        frames.sort(key=lambda fra: fra.messages, reverse=True)
+        self.names: dict[int, list[str]] = {}
+        self.shift: dict[int, np.ndarray] = {}  # range midpoints, subtracted to keep the sums well conditioned
+        self.block: dict[int, int] = {}  # first column of every frame in G
+        width = 0
+        for fra in frames:  # variance prefilter: signals that never change are left out
+            names = [key for key, ran in fra.value_range.items() if ran[0] != ran[1]]
+            if not names:
+                continue
+            self.names[fra.ID] = names
+            self.shift[fra.ID] = np.array([(fra.value_range[key][0] + fra.value_range[key][1]) / 2 for key in names])
+            self.block[fra.ID] = width
+            width += 1 + 2 * len(names)
+        self.sums = np.zeros(width)  # G
+        self.inner = {}  # id: [n, sum of v, sum of v v^T], pairs inside the frame
+        self.partners = {}  # id: [partner ids, their columns of G, positions of their counts, G at the last arrival]
+        self.cross = {}  # id: [sum of v dG, sum of v*v dcount, sum of dG], pairs with the partners
+        self.last_time = {}
+        ids = list(self.names)
+        self.pairs = 0
+        self.truncated = False
+        for i, y in enumerate(ids):
+            p = len(self.names[y])
+            if p > 1 and self.pairs + p * (p - 1) // 2 <= max_pairs:
+                self.pairs += p * (p - 1) // 2
+                self.inner[y] = [0, np.zeros(p), np.zeros((p, p))]
+            partners, cols, counts = [], [], []
+            for x in ids[i + 1:]:
+                q = len(self.names[x])
+                if self.pairs + p * q > max_pairs:
+                    self.truncated = True
+                    break
+                self.pairs += p * q
+                partners.append(x)
+                counts.append(len(cols))
+                cols += range(self.block[x], self.block[x] + 1 + 2 * q)
+            if partners:
+                self.partners[y] = [partners, np.array(cols), np.array(counts), np.zeros(len(cols))]
+                self.cross[y] = [np.zeros((p, len(cols))), np.zeros((p, len(partners))), np.zeros(len(cols))]
+
+    def add(self, f_id, time, info):
+        names = self.names.get(f_id)
+        if names is None:
+            return
+        v = np.round(np.array([info[key] for key in names], dtype=float), 4) - self.shift[f_id]
+        k = self.block[f_id]
+        p = len(names)
+        self.sums[k] += 1
+        self.sums[k + 1:k + 1 + p] += v
+        self.sums[k + 1 + p:k + 1 + 2 * p] += v * v
+        inner = self.inner.get(f_id)
+        if inner is not None:
+            inner[0] += 1
+            inner[1] += v
+            inner[2] += np.outer(v, v)
+        partner = self.partners.get(f_id)
+        if partner is None:
+            return
+        now = self.sums[partner[1]]
+        last = self.last_time.get(f_id)
+        if last is None or time - last < TIME_WINDOW:
+            diff = now - partner[3]
+            cross = self.cross[f_id]
+            cross[0] += np.outer(v, diff)
+            cross[1] += np.outer(v * v, diff[partner[2]])
+            cross[2] += diff
+        partner[3] = now
+        self.last_time[f_id] = time
+
+    def relations(self):
+        """(source id, source signal, end id, end signal, coefficient) of the pairs reaching MIN_SUPPORT"""
+        found = []
+        for y, (n, sy, syy) in self.inner.items():
+            cov = n * syy - np.outer(sy, sy)
+            cor = np.triu(_moment_correlation(n, cov, np.diag(cov), np.diag(syy), np.diag(cov), np.diag(syy)), 1)
+            found += self._above(y, y, cor)
+        for y, (partners, _, counts, _) in self.partners.items():
+            xy, yy, x_sums = self.cross[y]
+            for j, (x, k) in enumerate(zip(partners, counts)):
+                q = len(self.names[x])
+                n = x_sums[k]
+                sy = xy[:, k]
+                sx, sxx = x_sums[k + 1:k + 1 + q], x_sums[k + 1 + q:k + 1 + 2 * q]
+                cov = n * xy[:, k + 1:k + 1 + q] - np.outer(sy, sx)
+                cor = _moment_correlation(n, cov, n * yy[:, j] - sy * sy, yy[:, j], n * sxx - sx * sx, sxx)
+                found += self._above(y, x, cor)
+        return found
+
+    def _above(self, y, x, cor):
+        return [(y, self.names[y][r], x, self.names[x][c], float(cor[r, c]))
+                for r, c in zip(*np.nonzero(np.abs(cor) >= MIN_SUPPORT))]
+
+
+def _moment_correlation(n, cov, var_y, syy, var_x, sxx):
+    """Pearson coefficients from n times the co-moments and the sums of squares, nan where a side does not vary.
+
+    n times variances below 1e-10 of n times the sum of squares are cancellation noise of constant samples."""
+    if n < 2:
+        return np.full(cov.shape, np.nan)
+    var_y = np.where(var_y > 1e-10 * n * syy, var_y, np.nan)
+    var_x = np.where(var_x > 1e-10 * n * sxx, var_x, np.nan)
+    with np.errstate(invalid='ignore'):
+        return np.clip(cov / np.sqrt(np.outer(var_y, var_x)), -1, 1)
+
+
+def extract_relation_stream(trainFile, max_pairs=RELATION_PAIR_BUDGET, frames: FrameRegistry = None):
+    """Second pass over trainFile mining the relations of extract_relation() without keeping any series.
+
+    Runs after extract_info(), whose value ranges and message counts pick the candidate pairs,
+    their order under max_pairs and the shifts of the sums, none of which is known before the
+    end of the capture. The re-read mostly hits DECODE_CACHE: 7-10% of this pass, the rest is
+    RelationStream.add()."""
+    frames = Frames if frames is None else frames
+    stream = RelationStream(frames, max_pairs)
+    if stream.truncated:
+        print('Relation pair budget reached, following %d signal pairs' % stream.pairs)
+    for msg in read_file_generator(trainFile):
+        if msg.ID in stream.names:
+            stream.add(msg.ID, msg.time, decode_info(msg.ID, msg.data, msg.len))
+    for source_id, source_att, end_id, end_att, cor in stream.relations():
+        frames[source_id].add_relation(Relation(source_att, end_id, end_att, cor))
+
+
+def update_frame_info(origin: FrameRegistry, new: FrameRegistry):
+    """Merge the frame summaries of another capture into origin and return it"""
+    return origin.merge(new)
+
+
+def merge_tree(summaries):
+    """update_frame_info() over the summaries in order, pairing them up like a binary counter"""
+    stack = []  # (captures merged, frames), sizes decreasing
+    for frames in summaries:
+        size = 1
+        while stack and stack[-1][0] == size:
+            frames = update_frame_info(stack.pop()[1], frames)
+            size *= 2
+        stack.append((size, frames))
+    merged = FrameRegistry(new_frame)
+    while stack:
+        merged = update_frame_info(stack.pop()[1], merged)
+    return merged
+
+
+def train_capture(trainFile, relations=False):
+    """Frame summaries of one capture, without the series they were computed from"""
+    frames = FrameRegistry(new_frame)
+    DECODE_CACHE.clear()
+    extract_info(trainFile, frames)
+    if relations:
+        if ONLINE_STATS:
+            extract_relation_stream(trainFile, frames=frames)
+        else:
+            extract_relation(frames=frames)
+    for frame in frames:
+        frame.clear_series()
+    return frames
+
+
+def _init_train_worker(min_support, online, trace_dir):
+    global MIN_SUPPORT, ONLINE_STATS, TRACE_DIR
+    MIN_SUPPORT, ONLINE_STATS, TRACE_DIR = min_support, online, trace_dir
+
+
+def _summary_config(relations):
+    """Everything besides the capture the cached summaries depend on"""
+    return {'dbc': file_digest(DBC_FILE), 'min_support': MIN_SUPPORT, 'online': ONLINE_STATS, 'relations': relations,
+            'time_window': TIME_WINDOW, 'pair_budget': RELATION_PAIR_BUDGET}
+
+
+def train_parallel(files, workers=None, relations=False, cache_dir=None):
+    """train_capture() every file in a pool of processes and merge the summaries as they come.
+
+    With a cache_dir only the captures without a valid cached summary are trained, the others are read back."""
+    config = _summary_config(relations) if cache_dir else None
+    loaders = [cached_summary(file, cache_dir, config) if cache_dir else None for file in files]
+    todo = [file for file, loader in zip(files, loaders) if loader is None]
+    if cache_dir:
+        print('%d captures cached, %d to train' % (len(files) - len(todo), len(todo)))
+
+    def summaries(trained):
+        trained = iter(trained)
+        for file, loader in zip(files, loaders):
+            if loader is not None:
+                yield loader()
+                continue
+            frames = next(trained)
+            if cache_dir:
+                save_summary(file, frames, cache_dir, config)
+            yield frames
+
+    if workers == 1 or len(todo) <= 1:
+        return merge_tree(summaries(train_capture(file, relations) for file in todo))
+    with pool_context().Pool(workers, initializer=_init_train_worker, initargs=(MIN_SUPPORT, ONLINE_STATS, TRACE_DIR)) as pool:
+        return merge_tree(summaries(pool.imap(partial(train_capture, relations=relations), todo)))
+
+
+def main():
+    global KG_FILE, MIN_SUPPORT, TRACE_DIR
+    arg = 6
+    KG_FILE = r'../../data/KG/KG-ID_avg_period.ttl'
+    TRACE_DIR = r'../../data/traces'
+    MIN_SUPPORT += int(arg) / 100
+    MIN_SUPPORT = round(MIN_SUPPORT, 2)
+    graph = KnowledgeGraph(triple_store.STORE, KG_STORE) if KG_STORE else KnowledgeGraph()
+
+    print('MIN_SUPPORT: ' + str(MIN_SUPPORT))
+    print('KG_FILE: ' + str(KG_FILE))
+
+    frame_to_node = {}  # extract_node()
+
+    with open(r'../../data/ambient/capture_metadata.json') as f:
+        f_json = json.load(f)
+    train_files = [r'../../data/ambient/' + key + '.log' for key in f_json]
+    print('*************START************')
+    print('\n'.join(train_files))
+    frame_info = train_parallel(train_files, cache_dir=SUMMARY_DIR)
+    print('*************END************')
+
+    graph.add_new_info(frame_to_node, frame_info)
+    graph.commit()
+    graph.save_graph_as_turtle(KG_FILE)
+    graph.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import os
+import pickle
+
+from file_cache import cache_path, file_digest, file_key, same_source
+
+SUMMARY_VERSION = 3
+SUMMARY_SUFFIX = '.summary'
+
+
+def summary_path(cache_dir, trainFile):
+    return cache_path(cache_dir, trainFile, SUMMARY_SUFFIX)
+
+
+def save_summary(trainFile, frames, cache_dir, config):
+    """Write the frame summaries of a capture, bound to its path, size, mtime, checksum and the training config"""
+    os.makedirs(cache_dir, exist_ok=True)
+    summary_file = summary_path(cache_dir, trainFile)
+    header = {'version': SUMMARY_VERSION, 'config': config, 'digest': file_digest(trainFile)}
+    header.update(file_key(trainFile))
+    tmp_file = summary_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, summary_file)
+
+
+def _load_frames(summary_file, offset):
+    with open(summary_file, 'rb') as f:
+        f.seek(offset)
+        return pickle.load(f)
+
+
+def cached_summary(trainFile, cache_dir, config):
+    """Return a loader of the cached frame summaries of a capture, or None if they are missing or stale.
+
+    Only the header is read here."""
+    summary_file = summary_path(cache_dir, trainFile)
+    try:
+        key = file_key(trainFile)
+        with open(summary_file, 'rb') as f:
+            header = pickle.load(f)
+            offset = f.tell()
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+        return None
+    if header.get('version') != SUMMARY_VERSION or header.get('config') != config:
+        return None
+    if not same_source(header, key, trainFile):
+        return None
+    return lambda: _load_frames(summary_file, offset)
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+
+from rdflib import plugin
+from rdflib.store import NO_STORE, VALID_STORE, Store
+from rdflib.util import from_n3
+
+STORE = 'SQLiteTriples'  # plugin name of SQLiteStore, see register()
+
+
+class SQLiteStore(Store):
+    """rdflib store keeping the triples in one SQLite table, indexed by subject and by predicate/object.
+
+    Terms are stored in their N3 form. Nothing is loaded at open(), every lookup and
+    update only touches the rows it matches; changes are written on commit()."""
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self._db = None
+        super().__init__(configuration, identifier)
+
+    def open(self, configuration, create=True):
+        if not create and not os.path.exists(configuration):
+            return NO_STORE
+        self._db = sqlite3.connect(configuration)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS triples (s TEXT NOT NULL, p TEXT NOT NULL, o TEXT NOT NULL,
+                                                PRIMARY KEY (s, p, o)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS triples_po ON triples (p, o);
+            CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+        ''')
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self._db is None:
+            return
+        if commit_pending_transaction:
+            self._db.commit()
+        self._db.close()
+        self._db = None
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    @staticmethod
+    def _where(triple_pattern):
+        conditions, args = [], []
+        for column, term in zip('spo', triple_pattern):
+            if term is not None:
+                conditions.append(column + ' = ?')
+                args.append(term.n3())
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), args
+
+    def add(self, triple, context=None, quoted=False):
+        self._db.execute('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)', tuple(term.n3() for term in triple))
+
+    def addN(self, quads):
+        self._db.executemany('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)',
+                             ((s.n3(), p.n3(), o.n3()) for s, p, o, _ in quads))
+
+    def remove(self, triple_pattern, context=None):
+        where, args = self._where(triple_pattern)
+        self._db.execute('DELETE FROM triples' + where, args)
+
+    def triples(self, triple_pattern, context=None):
+        where, args = self._where(triple_pattern)
+        # fetched at once, callers often change the graph while iterating
+        rows = self._db.execute('SELECT s, p, o FROM triples' + where, args).fetchall()
+        s, p, o = triple_pattern
+        for row in rows:
+            yield (s if s is not None else from_n3(row[0]),
+                   p if p is not None else from_n3(row[1]),
+                   o if o is not None else from_n3(row[2])), iter(())
+
+    def __len__(self, context=None):
+        return self._db.execute('SELECT COUNT(*) FROM triples').fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        if self._db is None:
+            return
+        bound = self.namespace(prefix)
+        if bound is not None and not override:
+            return
+        self._db.execute('DELETE FROM namespaces WHERE uri = ?', (str(namespace),))
+        self._db.execute('INSERT OR REPLACE INTO namespaces VALUES (?, ?)', (prefix, str(namespace)))
+
+    def namespace(self, prefix):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT uri FROM namespaces WHERE prefix = ?', (prefix,)).fetchone()
+        return None if row is None else from_n3('<%s>' % row[0])
+
+    def prefix(self, namespace):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT prefix FROM namespaces WHERE uri = ?', (str(namespace),)).fetchone()
+        return None if row is None else row[0]
+
+    def namespaces(self):
+        if self._db is None:
+            return
+        for prefix, uri in self._db.execute('SELECT prefix, uri FROM namespaces').fetchall():
+            yield prefix, from_n3('<%s>' % uri)
+
+
+def register():
+    """Make SQLiteStore available to rdflib as Graph(store=STORE)"""
+    plugin.register(STORE, Store, 'triple_store', 'SQLiteStore')
@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'common'))
+from candump import read_batches, read_records
+
+LOG = (b'(0.000374) can0 577#0000080000000000 0\n'
+       b'(0.000482) can0 0D0#00B50462C70E0100 1\n'
+       b'(0.000635) can0 23G#05005F0000000000 0\n'  # not a hex id, but one token per field like a frame
+       b'(0.001247) can0 434#01CE80AC00516A00 0\n')
+
+
+def test_malformed_line_is_skipped(tmp_path):
+    path = tmp_path / 'trace.log'
+    path.write_bytes(LOG)
+    records = list(read_records(str(path)))
+    assert [(r.id, r.data, r.normal) for r in records] == [
+        (0x577, bytes.fromhex('0000080000000000'), True),
+        (0x0D0, bytes.fromhex('00B50462C70E0100'), False),
+        (0x434, bytes.fromhex('01CE80AC00516A00'), True)]
+    batch, = read_batches(str(path))
+    assert batch['id'].tolist() == [0x577, 0x0D0, 0x434]